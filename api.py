@@ -0,0 +1,228 @@
+"""
+JSON API for the deferral checker, served by the Dash app's Flask server.
+
+    POST /api/v1/classify        one trade  -> {"uk_sovereign": "1D", ...}
+    POST /api/v1/classify/batch  many trades -> {"count": n, "outcomes": {regime: [...]}}
+    GET  /api/v1/instruments/<isin>  reference data of one instrument
+    GET  /api/v1/ladder          one issue   -> trade-size breakpoints, per regime
+    GET  /api/v1/outcomes        outcome key -> message, per regime
+    GET  /api/v1/cache           lookup cache hit/miss/eviction counters
+
+Outcomes are the short keys from deferral_rules (RT, 15M, EOD, 1D, EOD_1W,
+EOD_2W, 2W, 4W, 3M, UNKNOWN, INCOMPLETE, or null where the rules give no
+outcome). Single trades use the scalar rules, batches the vectorised engine;
+both read the same compiled thresholds as the Dash callbacks.
+
+Trades are objects with the fields in FIELDS; a batch is either
+{"trades": [trade, ...]} or columnar {"columns": {field: [...], ...}}.
+Sizes are in the issue currency, which must be one of the fx_rates
+currencies (any case); others are a 400. With an instrument store configured
+($INSTRUMENTS_FILE), a trade may give an "isin" instead of the issue fields;
+fields the trade leaves empty are taken from the store. A "trade_date"
+(YYYY-MM-DD) selects the rules version in force on that date, otherwise the
+rules in force today are used. /ladder takes the same fields without
+trade_size and returns, per regime, the bands {from, inclusive, outcome,
+message} of trade sizes in the issue currency.
+"""
+
+import math
+
+import numpy as np
+from flask import Blueprint, jsonify, request
+
+import deferral_cache
+import deferral_rules
+import fx_rates
+import instruments
+import parallel
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+FIELDS = ("issue_currency", "issue_size", "trade_size", "maturity",
+          "issuer_country", "strip_inflation", "rating")
+SIZE_FIELDS = ("issue_size", "trade_size")
+TRADE_DATE = "trade_date"
+
+MAX_BATCH = 100000
+
+
+class BadRequest(ValueError):
+    pass
+
+
+@api.errorhandler(BadRequest)
+def bad_request(exc):
+    return jsonify(error=str(exc)), 400
+
+
+def _size(value, field):
+    if value is None or value == "":
+        raise BadRequest(f"{field} is required")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{field} must be a number")
+    if math.isnan(value):
+        raise BadRequest(f"{field} must be a number")
+    return value
+
+
+def _currency(value, where=""):
+    # Only currencies with rates in fx_rates: anything else would silently be
+    # converted at a rate of 1
+    if value is None or value == "":
+        raise BadRequest(f"{where}issue_currency is required")
+    currency = value.strip().upper() if isinstance(value, str) else None
+    if currency not in fx_rates.eur_xe or currency not in fx_rates.gbp_xe:
+        raise BadRequest(f"{where}unsupported issue_currency {value!r}")
+    return currency
+
+
+def _trade_date(value):
+    # Checked here so a malformed date is a 400, not an error in the rules
+    try:
+        deferral_rules.iso_date(value)
+    except ValueError as exc:
+        raise BadRequest(f"{TRADE_DATE}: {exc}")
+    return value
+
+
+def _payload():
+    if request.method == "GET":
+        return request.args.to_dict()
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        raise BadRequest("Expected a JSON object")
+    return payload
+
+
+def _with_reference(trade):
+    store = instruments.load()
+    reference = store.get(trade.get(instruments.ISIN)) if store is not None else None
+    if reference is None:
+        return trade
+    trade = dict(trade)
+    for field, value in reference.items():
+        if trade.get(field) in (None, "") and value is not None:
+            trade[field] = value
+    return trade
+
+
+@api.route("/classify", methods=["GET", "POST"])
+def classify():
+    trade = _with_reference(_payload())
+    return jsonify(deferral_rules.classify_trade(
+        _currency(trade.get("issue_currency")),
+        _size(trade.get("issue_size"), "issue_size"),
+        _size(trade.get("trade_size"), "trade_size"),
+        trade.get("maturity"),
+        trade.get("issuer_country"),
+        trade.get("strip_inflation"),
+        trade.get("rating"),
+        trade_date=_trade_date(trade.get(TRADE_DATE)),
+    ))
+
+
+def _batch_columns(payload):
+    if "columns" in payload:
+        columns = payload["columns"]
+        if not isinstance(columns, dict):
+            raise BadRequest("columns must be an object of field -> list")
+        lengths = {len(v) for v in columns.values() if isinstance(v, list)}
+        if len(lengths) != 1:
+            raise BadRequest("columns must be lists of the same length")
+        count = lengths.pop()
+        isins = columns.get(instruments.ISIN)
+        dates = columns.get(TRADE_DATE)
+        columns = {f: columns.get(f) for f in FIELDS}
+    elif "trades" in payload:
+        trades = payload["trades"]
+        if not isinstance(trades, list) or not all(isinstance(t, dict) for t in trades):
+            raise BadRequest("trades must be a list of objects")
+        count = len(trades)
+        isins = [t.get(instruments.ISIN) for t in trades]
+        dates = [t.get(TRADE_DATE) for t in trades]
+        columns = {f: [t.get(f) for t in trades] for f in FIELDS}
+    else:
+        raise BadRequest("Expected 'trades' or 'columns'")
+
+    if count > MAX_BATCH:
+        raise BadRequest(f"At most {MAX_BATCH} trades per request")
+    store = instruments.load() if isins is not None else None
+    for field in SIZE_FIELDS:
+        if columns[field] is None and field in instruments.ATTRIBUTES and store is not None:
+            columns[field] = [None] * count
+        if columns[field] is None:
+            raise BadRequest(f"{field} is required")
+        try:
+            columns[field] = np.array([np.nan if v is None else v for v in columns[field]], dtype=float)
+        except (TypeError, ValueError):
+            raise BadRequest(f"{field} must be numbers")
+    if store is not None:
+        columns = store.fill(isins, columns)
+    if columns["issue_currency"] is None:
+        raise BadRequest("issue_currency is required")
+    # One check per distinct code
+    upper = {}
+    for i, value in enumerate(columns["issue_currency"]):
+        if not (isinstance(value, str) and value in upper):
+            upper[value] = _currency(value, f"trade {i}: ")
+    columns["issue_currency"] = [upper[value] for value in columns["issue_currency"]]
+    if dates is not None:
+        if not isinstance(dates, list) or len(dates) != count:
+            raise BadRequest(f"{TRADE_DATE} must be a list with one date per trade")
+        parsed = []
+        for i, d in enumerate(dates):
+            try:
+                parsed.append(deferral_rules.iso_date(d))
+            except ValueError as exc:
+                raise BadRequest(f"trade {i}: {TRADE_DATE}: {exc}")
+        columns[TRADE_DATE] = np.array(parsed, dtype="datetime64[D]")
+    return count, columns
+
+
+@api.route("/classify/batch", methods=["POST"])
+def classify_batch():
+    count, columns = _batch_columns(_payload())
+    codes = parallel.classify(**{
+        f: np.array(v, dtype=object) if v is not None and f in FIELDS and f not in SIZE_FIELDS else v
+        for f, v in columns.items()})
+    keys = np.array(deferral_rules.OUTCOMES, dtype=object)
+    return jsonify(count=count, outcomes={regime: keys[c].tolist() for regime, c in codes.items()})
+
+
+@api.route("/instruments/<isin>")
+def instrument(isin):
+    store = instruments.load()
+    reference = store.get(isin) if store is not None else None
+    if reference is None:
+        return jsonify(error=f"Unknown ISIN {isin}"), 404
+    return jsonify(reference)
+
+
+@api.route("/ladder", methods=["GET", "POST"])
+def ladder():
+    issue = _payload()
+    ladders = deferral_rules.issue_ladders(
+        _currency(issue.get("issue_currency")),
+        _size(issue.get("issue_size"), "issue_size"),
+        issue.get("maturity"),
+        issue.get("issuer_country"),
+        issue.get("strip_inflation"),
+        issue.get("rating"),
+        trade_date=_trade_date(issue.get(TRADE_DATE)),
+    )
+    return jsonify({regime: {"segment": table["segment"],
+                             "bands": [dict(band, message=deferral_rules.message(regime, band["outcome"]))
+                                       for band in table["bands"]]}
+                    for regime, table in ladders.items()})
+
+
+@api.route("/cache")
+def cache_stats():
+    return jsonify(deferral_cache.stats())
+
+
+@api.route("/outcomes")
+def outcomes():
+    return jsonify(deferral_rules.MESSAGES)
@@ -0,0 +1,312 @@
+"""
+Benchmarks for the deferral checker.
+
+    python benchmarks/bench_trade_checker.py [-o results.json] [--compare previous.json]
+
+Runs on seeded synthetic trades (see synthetic.py) and measures:
+
+  scalar    per-trade latency of the rule lookups used by the Dash callbacks
+            and the single-trade API
+  batch     rows/second of the vectorised engine, the blotter chunk
+            classifier and the batch API
+  callback  round trip of the two Dash callbacks through the Flask test
+            client (POST /_dash-update-component), as the browser calls them
+
+Besides the timings, every run records a digest of the outcomes for the
+whole synthetic set, so a change that makes things faster but also changes
+an answer shows up when two result files are compared. --compare exits with
+status 1 if the digest differs or any figure regressed by more than
+--tolerance.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+
+import synthetic  # noqa: E402
+
+CALLBACK_STATES = {
+    "uk_sovereign": ["strip-inflation", "issuer-country", "issue-currency", "issue-size",
+                     "maturity-dropdown", "trade-size"],
+    "uk_corporate": ["issue-currency-2", "issue-size-2", "trade-size-2", "rating-dropdown"],
+}
+
+
+def _percentiles(samples_ns, unit_ns=1000):
+    samples = np.asarray(samples_ns, dtype=float) / unit_ns
+    return {"unit": "us", "better": "lower", "count": len(samples),
+            "mean": float(samples.mean()), "p50": float(np.percentile(samples, 50)),
+            "p99": float(np.percentile(samples, 99)), "value": float(np.percentile(samples, 50))}
+
+
+def _throughput(rows, seconds):
+    return {"unit": "rows/s", "better": "higher", "rows": rows, "seconds": seconds,
+            "value": rows / seconds}
+
+
+def _latency(fn, calls, warmup=1000):
+    # Warm the lookup caches first so the figures are steady state
+    for args in calls[:warmup]:
+        fn(*args)
+    samples = []
+    for args in calls:
+        start = time.perf_counter_ns()
+        fn(*args)
+        samples.append(time.perf_counter_ns() - start)
+    return _percentiles(samples)
+
+
+def _best_of(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_scalar(records):
+    import deferral_rules
+    import trade_checker
+    from fx_rates import eur_xe, gbp_xe
+
+    def converted(t):
+        eur, gbp = eur_xe.get(t["issue_currency"], 1), gbp_xe.get(t["issue_currency"], 1)
+        return t["issue_size"] * eur, t["issue_size"] * gbp, t["trade_size"] * eur, t["trade_size"] * gbp
+
+    sizes = [converted(t) for t in records]
+    results = {
+        "classify_trade": _latency(deferral_rules.classify_trade, [
+            (t["issue_currency"], t["issue_size"], t["trade_size"], t["maturity"],
+             t["issuer_country"], t["strip_inflation"], t["rating"]) for t in records]),
+        "uk_sovereign": _latency(deferral_rules.uk_sovereign, [
+            (s[1], s[3], t["maturity"], t["issuer_country"], t["strip_inflation"])
+            for t, s in zip(records, sizes)]),
+        "uk_corporate": _latency(deferral_rules.uk_corporate, [
+            (s[1], s[3], t["issue_currency"], t["rating"]) for t, s in zip(records, sizes)]),
+        "calculate_deferral_time_EU": _latency(trade_checker.calculate_deferral_time_EU, [
+            (s[0], s[2]) for s in sizes]),
+    }
+    return results
+
+
+def bench_batch(columns, repeat, workers=1):
+    import blotter
+    import deferral_engine
+
+    n = len(columns["trade_size"])
+    # Text columns as object arrays, as the blotter and the batch API pass them
+    objects = {k: v.astype(object) if v.dtype.kind == 'U' else v for k, v in columns.items()}
+    results = {"engine": _throughput(n, _best_of(repeat, lambda: deferral_engine.classify(**columns))),
+               "engine_objects": _throughput(n, _best_of(repeat, lambda: deferral_engine.classify(**objects)))}
+    # The part parallel.classify() does in the parent before sharding
+    results["encode_objects"] = _throughput(n, _best_of(repeat, lambda: [
+        deferral_engine.encode(objects[name]) for name in deferral_engine.LABEL_COLUMNS]))
+    if workers > 1:
+        import parallel
+        parallel.classify(**columns, workers=workers)  # start the pool
+        results[f"engine_{workers}_workers"] = _throughput(
+            n, _best_of(repeat, lambda: parallel.classify(**columns, workers=workers)))
+        results[f"engine_objects_{workers}_workers"] = _throughput(
+            n, _best_of(repeat, lambda: parallel.classify(**objects, workers=workers)))
+
+    header = list(columns)
+    rows = [list(r) for r in zip(*(columns[k].tolist() for k in header))]
+    chunk = rows[:blotter.CHUNK_SIZE]
+    results["blotter_chunk"] = _throughput(
+        len(chunk), _best_of(repeat, lambda: blotter.classify_chunk(header, chunk)))
+    return results
+
+
+def _client():
+    import trade_checker
+    return trade_checker.server.test_client()
+
+
+def bench_api(client, records, repeat):
+    single = records[:2000]
+    samples = []
+    for t in single:
+        start = time.perf_counter_ns()
+        response = client.post("/api/v1/classify", json=t)
+        samples.append(time.perf_counter_ns() - start)
+        assert response.status_code == 200, response.data
+    batch = {"trades": records}
+    results = {"api_single": _percentiles(samples)}
+
+    def post_batch():
+        response = client.post("/api/v1/classify/batch", json=batch)
+        assert response.status_code == 200, response.data
+    results["api_batch"] = _throughput(len(records), _best_of(repeat, post_batch))
+    return results
+
+
+def _callback_payload(outputs, button, states, values):
+    return {
+        "output": ".." + "...".join(f"{o}.children" for o in outputs) + "..",
+        "outputs": [{"id": o, "property": "children"} for o in outputs],
+        "inputs": [{"id": button, "property": "n_clicks", "value": 1}],
+        "changedPropIds": [f"{button}.n_clicks"],
+        "state": [{"id": s, "property": "value", "value": v} for s, v in zip(states, values)],
+    }
+
+
+def bench_callbacks(client, records):
+    payloads = {
+        "callback_uk_sovereign": [_callback_payload(
+            ["output-result", "output-result-2", "output-result-3"], "calculate-button",
+            CALLBACK_STATES["uk_sovereign"],
+            [t["strip_inflation"], t["issuer_country"], t["issue_currency"], t["issue_size"],
+             t["maturity"], t["trade_size"]]) for t in records],
+        "callback_uk_corporate": [_callback_payload(
+            ["deferral-output-1", "deferral-output-2", "deferral-output-3"], "calculate-deferral-button",
+            CALLBACK_STATES["uk_corporate"],
+            [t["issue_currency"], t["issue_size"], t["trade_size"], t["rating"]]) for t in records],
+    }
+    results = {}
+    for name, bodies in payloads.items():
+        samples = []
+        for body in bodies:
+            start = time.perf_counter_ns()
+            response = client.post("/_dash-update-component", json=body)
+            samples.append(time.perf_counter_ns() - start)
+            # 204 is PreventUpdate, for combinations the rules give no outcome
+            assert response.status_code in (200, 204), response.data
+        results[name] = _percentiles(samples)
+    return results
+
+
+def outcome_digest(columns, records):
+    """Digest of the engine and scalar outcomes for the synthetic trades."""
+    import deferral_engine
+    import deferral_rules
+
+    digest = hashlib.sha1()
+    for regime, codes in sorted(deferral_engine.classify(**columns).items()):
+        digest.update(regime.encode())
+        digest.update(np.ascontiguousarray(codes, dtype=np.int8).tobytes())
+    for t in records:
+        digest.update(json.dumps(deferral_rules.classify_trade(
+            t["issue_currency"], t["issue_size"], t["trade_size"], t["maturity"],
+            t["issuer_country"], t["strip_inflation"], t["rating"]), sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def check_coverage():
+    # The generators must keep up with the options offered in the UI
+    import trade_checker
+    for name, values in (("currency_options", synthetic.CURRENCIES),
+                         ("country_options", synthetic.COUNTRIES)):
+        offered = {o["value"] for o in getattr(trade_checker, name)}
+        if offered != set(values):
+            raise SystemExit(f"synthetic.py does not cover {name}: {sorted(offered ^ set(values))}")
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    check_coverage()
+    columns = synthetic.trades(args.batch_size, seed=args.seed)
+    records = synthetic.records(args.scalar_size, seed=args.seed)
+
+    results = {}
+    results.update(bench_scalar(records))
+    results.update(bench_batch(columns, args.repeat, args.workers))
+    client = _client()
+    results.update(bench_api(client, synthetic.records(min(args.batch_size, 100000), seed=args.seed),
+                             args.repeat))
+    results.update(bench_callbacks(client, records[:args.callback_size]))
+
+    return {
+        "meta": {
+            "revision": _git_revision(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "batch_size": args.batch_size,
+            "scalar_size": args.scalar_size,
+            "callback_size": args.callback_size,
+            "workers": args.workers,
+        },
+        "digest": outcome_digest(columns, records),
+        "results": results,
+    }
+
+
+def compare(current, previous, tolerance):
+    """Print current vs previous figures; return False on regressions."""
+    ok = True
+    if current["digest"] != previous.get("digest"):
+        print("OUTCOMES CHANGED: digest differs from the previous run", file=sys.stderr)
+        ok = False
+    if current["meta"].get("seed") != previous.get("meta", {}).get("seed"):
+        print("warning: runs used different seeds, digests are not comparable", file=sys.stderr)
+
+    print(f"{'benchmark':32} {'previous':>14} {'current':>14} {'change':>8}")
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if before is None:
+            print(f"{name:32} {'-':>14} {result['value']:>14.1f} {'new':>8}")
+            continue
+        change = result["value"] / before["value"] - 1
+        worse = -change if result["better"] == "higher" else change
+        flag = " REGRESSION" if worse > tolerance else ""
+        ok = ok and not flag
+        print(f"{name:32} {before['value']:>14.1f} {result['value']:>14.1f} {change:>+8.1%}"
+              f" {result['unit']}{flag}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", default="bench_results.json",
+                        help="where to write the results (default: %(default)s)")
+    parser.add_argument("--compare", metavar="PREVIOUS", help="results file of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown when comparing, as a fraction (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=200000, help="trades per batch benchmark")
+    parser.add_argument("--scalar-size", type=int, default=20000, help="trades timed one by one")
+    parser.add_argument("--callback-size", type=int, default=2000, help="callback round trips per callback")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for the parallel engine benchmark (default: all cores)")
+    parser.add_argument("--repeat", type=int, default=3, help="batch runs, the best is kept")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"digest {results['digest']}  written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if not compare(results, previous, args.tolerance):
+            return 1
+    else:
+        for name, result in results["results"].items():
+            print(f"{name:32} {result['value']:>14.1f} {result['unit']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+Check the rules engine against the original Dash callbacks.
+
+    python benchmarks/check_reference.py [--trades 40000] [--seed 0]
+
+The deferral logic the Dash app shipped with, before the thresholds moved
+into deferral_rules.json, is kept below as the reference: the if/elif
+ladders of calculate_deferral_time, calculate_deferral_times and
+calculate_deferral_time_EU, copied with only the Dash components removed.
+Seeded synthetic trades clustered on every threshold (a share with missing
+sizes) are classified by the reference, by deferral_engine.classify() and by
+deferral_rules.classify_trade() under the shipped deferral_rules.json, and
+the messages must be identical. Exits with status 1 on any mismatch.
+
+Where no branch of the original matched, the callback raised
+UnboundLocalError; the reference returns None there, which the engine must
+report as no outcome.
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+
+import deferral_engine  # noqa: E402
+import deferral_rules  # noqa: E402
+import synthetic  # noqa: E402
+from deferral_rules import REGIMES  # noqa: E402
+from fx_rates import eur_xe, gbp_xe  # noqa: E402
+
+SHIPPED_RULES = os.path.join(ROOT, "deferral_rules.json")
+
+
+def calculate_deferral_time_EU(issue_size_eur, trade_size_eur):
+    if trade_size_eur < 5 * (10**6):
+        return "Price and volume in real time"
+
+    if issue_size_eur >= 1 * (10**9):
+        if 5 * (10**6) <= trade_size_eur < 15 * (10**6):
+            return "Price and volume deferred 15 minutes"
+        elif 15 * (10**6) <= trade_size_eur < 50 * (10**6):
+            return "EOD price deferral and 1 week volume deferral"
+
+    elif issue_size_eur < 1 * (10**9):
+        if 5 * (10**6) <= trade_size_eur < 15 * (10**6):
+            return "Price and volume deferred EOD"
+        elif 15 * (10**6) <= trade_size_eur < 50 * (10**6):
+            return "EOD price deferral and 2 week volume deferral"
+
+    if trade_size_eur >= 50 * (10**6):
+        return "Price and volume deferred 4 weeks"
+
+    return "Unknown condition"
+
+
+def calculate_deferral_time(strip_inflation, issuer_country, issue_currency, issue_size, maturity, trade_size):
+    # Convert Issue Size and Trade Size into EUR and GBP
+    issue_size_eur = issue_size * eur_xe.get(issue_currency, 1)
+    issue_size_gbp = issue_size * gbp_xe.get(issue_currency, 1)
+    trade_size_eur = trade_size * eur_xe.get(issue_currency, 1)
+    trade_size_gbp = trade_size * gbp_xe.get(issue_currency, 1)
+
+    uno = "Price and volume in real time"
+    due = "Price and volume deferred 1 day"
+    tre = "Price and volume deferred 2 weeks"
+    quattro = "Price and volume deferred 3 months"
+
+    message = None  # the callback raised UnboundLocalError if nothing below matched
+    if issue_size_gbp >= 2 * (10**9):
+        if issuer_country in ['UK', 'FR', 'DE', 'IT', 'US', 'ES'] and strip_inflation == 'No':
+            if maturity == '<5':
+                if trade_size_gbp <= 15 * (10**6):
+                    message = uno
+                elif 15 * (10**6) < trade_size_gbp < 50 * (10**6):
+                    message = due
+                elif 50 * (10**6) < trade_size_gbp <= 500 * (10**6):
+                    message = tre
+                elif trade_size_gbp > 500 * (10**6):
+                    message = quattro
+
+            elif maturity == '5-15':
+                if trade_size_gbp <= 10 * (10**6):
+                    message = uno
+                elif 10 * (10**6) < trade_size_gbp <= 25 * (10**6):
+                    message = due
+                elif 25 * (10**6) < trade_size_gbp <= 250 * (10**6):
+                    message = tre
+                elif trade_size_gbp > 250 * (10**6):
+                    message = quattro
+            elif maturity == '>15':
+                if trade_size_gbp <= 5 * (10**6):
+                    message = uno
+                elif 5 * (10**6) < trade_size_gbp <= 10 * (10**6):
+                    message = due
+                elif 10 * (10**6) < trade_size_gbp <= 100 * (10**6):
+                    message = tre
+                elif trade_size_gbp > 100 * (10**6):
+                    message = quattro
+        else:
+            if trade_size_gbp <= 1 * (10**6):
+                message = uno
+            elif 1 * (10**6) < trade_size_gbp <= 5 * (10**6):
+                message = due
+            elif 5 * (10**6) < trade_size_gbp <= 25 * (10**6):
+                message = tre
+            elif trade_size_gbp > 25 * (10**6):
+                message = quattro
+
+    elif issue_size_gbp < 2 * (10**9):
+        if trade_size_gbp <= 1 * (10**6):
+            message = uno
+        elif 1 * (10**6) < trade_size_gbp <= 2.5 * (10**6):
+            message = due
+        elif 2.5 * (10**6) < trade_size_gbp <= 10 * (10**6):
+            message = tre
+        elif trade_size_gbp > 10 * (10**6):
+            message = quattro
+    else:
+        message = "Enter all fields or contact ICMA"
+
+    eu_message = calculate_deferral_time_EU(issue_size_eur, trade_size_eur)
+    return message, eu_message
+
+
+def calculate_deferral_times(issue_currency, issue_size, trade_size, rating):
+    # Convert Issue Size and Trade Size into EUR and GBP
+    issue_size_eur = issue_size * eur_xe.get(issue_currency, 1)
+    issue_size_gbp = issue_size * gbp_xe.get(issue_currency, 1)
+    trade_size_eur = trade_size * eur_xe.get(issue_currency, 1)
+    trade_size_gbp = trade_size * gbp_xe.get(issue_currency, 1)
+
+    deferral_1 = None  # the callback raised UnboundLocalError if nothing below matched
+    if issue_size_gbp >= 500 * (10**6) and issue_currency in ['EUR', 'USD', 'GBP']:
+        if rating == 'IG':
+            if trade_size_gbp <= 1 * (10**6):
+                deferral_1 = "Price and volume in real time"
+            elif 1 * (10**6) < trade_size_gbp <= 5 * (10**6):
+                deferral_1 = "Price and volume deferred 1 day"
+            elif 5 * (10**6) < trade_size_gbp <= 25 * (10**6):
+                deferral_1 = "Price and volume deferred 2 weeks"
+            elif trade_size_gbp > 25 * (10**6):
+                deferral_1 = "Price and volume deferred 3 months"
+        elif rating == 'HY':
+            if trade_size_gbp <= 1 * (10**6):
+                deferral_1 = "Price and volume in real time"
+            elif 1 * (10**6) < trade_size_gbp <= 2.5 * (10**6):
+                deferral_1 = "Price and volume deferred 1 day"
+            elif 2.5 * (10**6) < trade_size_gbp <= 10 * (10**6):
+                deferral_1 = "Price and volume deferred 2 weeks"
+            elif trade_size_gbp > 10 * (10**6):
+                deferral_1 = "Price and volume deferred 3 months"
+    elif (issue_size_gbp < 500 * (10**6)) or (issue_size_gbp >= 500 * (10**6) and issue_currency not in ['EUR', 'USD', 'GBP']):
+        if trade_size_gbp <= 0.5 * (10**6):
+            deferral_1 = "Price and volume in real time"
+        elif 0.5 * (10**6) < trade_size_gbp <= 2.5 * (10**6):
+            deferral_1 = "Price and volume deferred 1 day"
+        elif 2.5 * (10**6) < trade_size_gbp <= 10 * (10**6):
+            deferral_1 = "Price and volume deferred 2 weeks"
+        elif trade_size_gbp > 10 * (10**6):
+            deferral_1 = "Price and volume deferred 3 months"
+    else:
+        deferral_1 = "Enter all fields or contact ICMA"
+
+    if trade_size_eur < 1 * (10**6):
+        deferral_2 = "Price and volume in real time (corporate, convertible and other bonds)"
+    elif issue_size_eur >= 500 * (10**6) and 1 * (10**6) <= trade_size_eur < 5 * (10**6):
+        deferral_2 = "Price and volume deferred 15 minutes (corporate, convertible and other bonds)"
+    elif issue_size_eur >= 500 * (10**6) and 5 * (10**6) <= trade_size_eur < 15 * (10**6):
+        deferral_2 = "EOD price deferral and 1 week volume deferral (corporate, convertible and other bonds)"
+    elif issue_size_eur < 500 * (10**6) and 1 * (10**6) <= trade_size_eur < 5 * (10**6):
+        deferral_2 = "Price and volume deferred EOD (corporate, convertible and other bonds)"
+    elif issue_size_eur < 500 * (10**6) and 5 * (10**6) <= trade_size_eur < 15 * (10**6):
+        deferral_2 = "EOD price deferral and 2 week volume deferral (corporate, convertible and other bonds)"
+    elif trade_size_eur >= 15 * (10**6):
+        deferral_2 = "Price and volume deferred 4 weeks (corporate, convertible and other bonds)"
+    else:
+        deferral_2 = "Enter all fields or contact ICMA"
+
+    if trade_size_eur < 5 * (10**6):
+        deferral_3 = "Price and volume in real time (covered bonds only)"
+    elif issue_size_eur >= 250 * (10**6) and 5 * (10**6) <= trade_size_eur < 15 * (10**6):
+        deferral_3 = "Price and volume deferred 15 minutes (covered bonds only)"
+    elif issue_size_eur >= 250 * (10**6) and 15 * (10**6) <= trade_size_eur < 50 * (10**6):
+        deferral_3 = "EOD price deferral and 1 week volume deferral (covered bonds only)"
+    elif issue_size_eur < 250 * (10**6) and 5 * (10**6) <= trade_size_eur < 15 * (10**6):
+        deferral_3 = "Price and volume deferred EOD (covered bonds only)"
+    elif issue_size_eur < 250 * (10**6) and 15 * (10**6) <= trade_size_eur < 50 * (10**6):
+        deferral_3 = "EOD price deferral and 2 week volume deferral (covered bonds only)"
+    elif trade_size_eur >= 50 * (10**6):
+        deferral_3 = "Price and volume deferred 4 weeks (covered bonds only)"
+    else:
+        deferral_3 = "Enter all fields or contact ICMA"
+
+    return deferral_1, deferral_2, deferral_3
+
+
+def reference(trade):
+    """{regime: message} of one trade under the original callbacks."""
+    uk_sovereign, eu_sovereign = calculate_deferral_time(
+        trade["strip_inflation"], trade["issuer_country"], trade["issue_currency"],
+        trade["issue_size"], trade["maturity"], trade["trade_size"])
+    uk_corporate, eu_corporate, eu_covered = calculate_deferral_times(
+        trade["issue_currency"], trade["issue_size"], trade["trade_size"], trade["rating"])
+    return {"uk_sovereign": uk_sovereign, "uk_corporate": uk_corporate, "eu_sovereign": eu_sovereign,
+            "eu_corporate": eu_corporate, "eu_covered": eu_covered}
+
+
+def trades(n, seed=0, missing=0.02):
+    """Synthetic trades near every threshold, with a share of missing (NaN) sizes."""
+    columns = synthetic.trades(n, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    for name in ("issue_size", "trade_size"):
+        columns[name] = np.where(rng.random(n) < missing, np.nan, columns[name])
+    return columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the rules engine with the original callbacks.")
+    parser.add_argument("--trades", type=int, default=40000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rules = deferral_rules.load(SHIPPED_RULES)
+    columns = trades(args.trades, args.seed)
+    names = list(columns)
+    rows = [dict(zip(names, values)) for values in zip(*(columns[name].tolist() for name in names))]
+
+    engine = deferral_engine.classify_messages(**columns, rules=rules)
+    mismatches = {regime: 0 for regime in REGIMES}
+    shown = 0
+    for i, trade in enumerate(rows):
+        expected = reference(trade)
+        scalar = deferral_rules.classify_trade(**trade, rules=rules)
+        for regime in REGIMES:
+            got = (engine[regime][i], deferral_rules.message(regime, scalar[regime]))
+            if got != (expected[regime], expected[regime]):
+                mismatches[regime] += 1
+                if shown < 10:
+                    shown += 1
+                    print(f"{regime}: {trade} -> reference {expected[regime]!r}, "
+                          f"engine {got[0]!r}, classify_trade {got[1]!r}")
+
+    for regime in REGIMES:
+        print(f"{regime:<14} {mismatches[regime]:>6} mismatches in {len(rows):,} trades")
+    return 1 if any(mismatches.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Local trade feed for stream_service.py.
+
+    python benchmarks/feed_simulator.py --spawn --count 100000 --check
+    python benchmarks/feed_simulator.py --port 8765 --rate 5000 --count 50000
+
+Sends seeded synthetic trades (see synthetic.py) as JSON lines, at --rate
+trades per second or as fast as the service accepts them, and reads the
+answers back. Reports throughput and the p50/p99 round trip seen by the
+client; --check also compares every answer with deferral_rules.classify_trade.
+--spawn runs the service in this process on a free port, so the whole path
+can be exercised without starting anything else.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+
+import synthetic  # noqa: E402
+
+TICK = 0.001
+
+
+async def send(writer, trades, rate, sent):
+    start = time.perf_counter()
+    for i, trade in enumerate(trades):
+        if rate and i % max(int(rate * TICK), 1) == 0:
+            # Open loop: keep to the schedule whatever the answers do
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        sent[i] = time.perf_counter()
+        writer.write(json.dumps(dict(trade, id=i)).encode() + b"\n")
+        if i % 256 == 255:
+            await writer.drain()
+    await writer.drain()
+
+
+async def receive(reader, count, sent, latencies, answers):
+    for _ in range(count):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError(f"Connection closed after {len(answers)} answers")
+        response = json.loads(line)
+        latencies.append(time.perf_counter() - sent[response["id"]])
+        answers[response["id"]] = response
+
+
+async def run(args):
+    server = None
+    if args.spawn:
+        import stream_service
+        service = stream_service.StreamService()
+        server = await asyncio.start_server(service.handle, "127.0.0.1", 0)
+        batcher = asyncio.ensure_future(service.batcher())
+        host, port = server.sockets[0].getsockname()[:2]
+        reader, writer = await asyncio.open_connection(host, port)
+    elif args.unix:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+
+    trades = synthetic.records(args.count, seed=args.seed)
+    sent, latencies, answers = {}, [], {}
+    start = time.perf_counter()
+    await asyncio.gather(send(writer, trades, args.rate, sent),
+                         receive(reader, len(trades), sent, latencies, answers))
+    seconds = time.perf_counter() - start
+    writer.close()
+    await writer.wait_closed()
+    if server is not None:
+        server.close()
+        await service.wait_closed()
+        batcher.cancel()
+        print(f"service: mean batch {service.trades / service.batches:.1f} trades")
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e6
+    print(f"{len(answers):,} trades in {seconds:.2f}s ({len(answers) / seconds:,.0f} trades/sec), "
+          f"round trip p50 {p50:,.0f}us p99 {p99:,.0f}us")
+
+    if args.check:
+        import deferral_rules
+        wrong = 0
+        for i, trade in enumerate(trades):
+            expected = deferral_rules.classify_trade(
+                trade["issue_currency"], trade["issue_size"], trade["trade_size"], trade["maturity"],
+                trade["issuer_country"], trade["strip_inflation"], trade["rating"])
+            if answers[i].get("outcomes") != expected:
+                wrong += 1
+                if wrong <= 5:
+                    print(f"trade {i}: expected {expected}, got {answers[i]}", file=sys.stderr)
+        print(f"{wrong} answers differ from deferral_rules.classify_trade")
+        return 1 if wrong else 0
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="connect to this Unix socket instead of TCP")
+    parser.add_argument("--spawn", action="store_true", help="run the service in this process")
+    parser.add_argument("--count", type=int, default=10000, help="trades to send")
+    parser.add_argument("--rate", type=float, default=0, help="trades per second, 0 for as fast as possible")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="verify every answer")
+    args = parser.parse_args(argv)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
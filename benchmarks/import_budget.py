@@ -0,0 +1,79 @@
+"""
+Import time budget for the Dash-free core.
+
+    python benchmarks/import_budget.py [--runs 7] [--scale 1.0]
+
+Each module is imported in a fresh interpreter, best of --runs, and must stay
+within its budget (milliseconds, on top of interpreter start-up) without
+loading any of the web or numeric stack. Exits with status 1 if a budget is
+exceeded or a forbidden module is loaded. --scale multiplies every budget,
+for slow CI machines.
+
+The full Dash app (trade_checker.server) is timed as well, for reference.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module -> budget in ms, None to only report
+BUDGETS = {
+    "fx_rates": 5,
+    "deferral_rules": 20,
+    "trade_checker": 30,
+    "trade_checker.server": None,
+}
+
+FORBIDDEN = ("dash", "dash_bootstrap_components", "flask", "werkzeug", "plotly", "numpy", "pandas")
+
+# Only sys and time are imported before the clock starts
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+module, _, attribute = {target!r}.partition(".")
+module = __import__(module)
+if attribute:
+    getattr(module, attribute)
+elapsed = time.perf_counter() - start
+print(elapsed * 1000, *sorted(m for m in {forbidden!r} if m in sys.modules))
+"""
+
+
+def measure(target, runs):
+    best, loaded = None, []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _PROBE.format(target=target, forbidden=FORBIDDEN)],
+                             cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        ms, *loaded = out.split()
+        best = float(ms) if best is None else min(best, float(ms))
+    return best, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import time of the Dash-free core.")
+    parser.add_argument("--runs", type=int, default=7, help="imports per module, the best is kept")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget by this")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for target, budget in BUDGETS.items():
+        ms, loaded = measure(target, args.runs)
+        if budget is None:
+            print(f"{target:<24} {ms:8.1f} ms")
+            continue
+        limit = budget * args.scale
+        problems = []
+        if ms > limit:
+            problems.append(f"over budget of {limit:.0f} ms")
+        if loaded:
+            problems.append(f"loads {', '.join(loaded)}")
+        failed = failed or bool(problems)
+        print(f"{target:<24} {ms:8.1f} ms  (budget {limit:.0f} ms)  {'; '.join(problems) or 'ok'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
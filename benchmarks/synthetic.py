@@ -0,0 +1,68 @@
+"""
+Seeded synthetic trades for benchmarks and simulators.
+
+Trades cover every currency and issuer country offered in the Dash dropdowns,
+all maturity buckets, both ratings and both strip/linker flags. Issue and
+trade sizes are clustered around the thresholds in deferral_rules.json
+(converted into each issue currency), so every band edge is exercised,
+including sizes exactly on a threshold.
+"""
+
+import numpy as np
+
+import deferral_rules
+from fx_rates import eur_xe, gbp_xe
+
+CURRENCIES = ["EUR", "USD", "GBP", "PLN", "HUF", "CZK", "RON", "NOK", "DKK", "SEK",
+              "ISK", "BGN", "CHF", "CAD", "JPY"]
+COUNTRIES = ["UK", "FR", "DE", "IT", "US", "ES", "Other"]
+MATURITIES = ["<5", "5-15", ">15"]
+RATINGS = ["IG", "HY"]
+STRIP = ["Yes", "No"]
+
+
+def thresholds(rules=None):
+    """(issue size thresholds, trade size thresholds) as [(currency, value)]."""
+    rules = rules or deferral_rules.load()
+    issue, trade = set(), set()
+    for regime in deferral_rules.REGIMES:
+        spec = rules[regime]
+        issue.add((spec["currency"], float(spec["issue_size_threshold"])))
+        for segment in rules.segments(regime):
+            for _, value in rules.ladders[regime, segment].breaks:
+                trade.add((spec["currency"], value))
+    return sorted(issue), sorted(trade)
+
+
+def _near(rng, points, currency, n):
+    # Pick a threshold, convert it into the issue currency and jitter it by up
+    # to 1%; one in eight sizes lands exactly on the threshold.
+    pick = rng.integers(0, len(points), n)
+    base = np.array([v for _, v in points])[pick]
+    rate = np.array([(eur_xe if c == "EUR" else gbp_xe)[ccy]
+                     for (c, _), ccy in zip([points[i] for i in pick], currency)])
+    jitter = np.where(rng.random(n) < 0.125, 1.0, 1 + rng.uniform(-0.01, 0.01, n))
+    return base / rate * jitter
+
+
+def trades(n, seed=0, rules=None):
+    """n synthetic trades as a dict of column arrays (sizes in issue currency)."""
+    rng = np.random.default_rng(seed)
+    issue_points, trade_points = thresholds(rules)
+    currency = rng.choice(CURRENCIES, n)
+    return {
+        "issue_currency": currency,
+        "issue_size": _near(rng, issue_points, currency, n),
+        "trade_size": _near(rng, trade_points, currency, n),
+        "maturity": rng.choice(MATURITIES, n),
+        "issuer_country": rng.choice(COUNTRIES, n),
+        "strip_inflation": rng.choice(STRIP, n),
+        "rating": rng.choice(RATINGS, n),
+    }
+
+
+def records(n, seed=0, rules=None):
+    """Same trades as trades(), one dict per trade with plain Python values."""
+    columns = trades(n, seed, rules)
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*(columns[k].tolist() for k in names))]
@@ -0,0 +1,366 @@
+"""
+Streaming classification of trade blotters (CSV or Excel).
+
+Rows are read lazily (csv.reader, or openpyxl in read-only mode), classified
+in fixed size chunks with deferral_engine and written straight back out with
+the deferral columns appended, so memory use does not grow with the file.
+
+Uploads from the Dash page are handled as background jobs. Each job lives in
+its own directory under JOBS_DIR with the input, the output and a small
+status.json file, so any gunicorn worker can report progress or serve the
+result regardless of which worker is running the job.
+"""
+
+import csv
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+import deferral_engine
+import deferral_rules
+import fx_history
+import parallel
+from fx_rates import eur_xe, gbp_xe
+
+JOBS_DIR = os.environ.get(
+    "BLOTTER_JOBS_DIR", os.path.join(tempfile.gettempdir(), "trade-deferral-checker-jobs"))
+# Seconds a job directory (input, output and status) is kept after its last
+# update; older ones are deleted whenever a new job starts
+JOB_TTL = float(os.environ.get("BLOTTER_JOB_TTL", 24 * 3600))
+
+CHUNK_SIZE = 10000
+
+# Input columns understood by the classifier. Headers are matched case
+# insensitively with spaces treated as underscores ("Issue Size" -> issue_size).
+COLUMNS = ("issue_currency", "issue_size", "trade_size", "maturity",
+           "issuer_country", "strip_inflation", "rating")
+NUMERIC_COLUMNS = ("issue_size", "trade_size")
+# Optional: when present, trades are classified under the rules in force on
+# the trade date and, if an FX history is configured, sizes are converted at
+# the rates that applied on that date instead of the fx_rates snapshot
+TRADE_DATE = "trade_date"
+# Optional: with an instruments.InstrumentStore, issue attributes left empty
+# are filled in from the reference data of the trade's ISIN
+ISIN = "isin"
+
+RESULT_COLUMNS = {
+    "uk_sovereign": "UK deferral (sovereign)",
+    "eu_sovereign": "EU deferral (sovereign)",
+    "uk_corporate": "UK deferral (corporate)",
+    "eu_corporate": "EU deferral (corporate)",
+    "eu_covered": "EU deferral (covered)",
+}
+
+
+def normalise_header(name):
+    return str(name or "").strip().lower().replace(" ", "_").replace("-", "_")
+
+
+def number(value):
+    """A size cell as a float, NaN if empty or not a number."""
+    if value is None or value == "":
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def parse_date(value):
+    """A trade date cell as datetime64[D], NaT if empty.
+
+    Only YYYY-MM-DD is accepted, as by the API. Anything else raises
+    ValueError instead of being classified under today's rules.
+    """
+    return np.datetime64(deferral_rules.iso_date(value) or "NaT", "D")
+
+
+class RowError(ValueError):
+    """A trade that cannot be classified; row is its 1-based position among the trades."""
+
+    def __init__(self, row, message):
+        super().__init__(f"row {row}: {message}")
+        self.row = row
+
+
+def label(value):
+    """A text cell stripped, None if empty."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def file_format(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        return "xlsx"
+    if ext in (".csv", ".txt"):
+        return "csv"
+    raise ValueError(f"Unsupported file type '{ext}', upload a .csv or .xlsx file")
+
+
+def read_rows(path, fmt):
+    """Return (header, rows, total) where rows is a lazy iterator of lists.
+
+    total is the number of data rows if it can be known without reading the
+    whole file into memory, otherwise None.
+    """
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            total = max(sum(1 for _ in f) - 1, 0)
+        f = open(path, newline="", encoding="utf-8-sig")
+        reader = csv.reader(f)
+        header = next(reader, [])
+        return header, _closing(reader, f), total
+
+    import openpyxl
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    ws = wb.worksheets[0]
+    rows = ws.iter_rows(values_only=True)
+    header = list(next(rows, ()))
+    total = ws.max_row - 1 if ws.max_row else None
+    return header, _closing(rows, wb), total
+
+
+def _closing(rows, handle):
+    try:
+        yield from rows
+    finally:
+        handle.close()
+
+
+def chunks(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def column(positions, rows, name, parse):
+    """parse() of the cell in column name of each row; parse(None) where it is missing.
+
+    positions maps normalised header names to their index in the rows.
+    """
+    i = positions.get(name)
+    if i is None:
+        return [parse(None)] * len(rows)
+    return [parse(row[i]) if i < len(row) else parse(None) for row in rows]
+
+
+def parse_chunk(header, rows, fx=None, instruments=None, first_row=1):
+    """Columns of a list of raw rows as keyword arguments for deferral_engine.classify().
+
+    fx is an optional fx_history.FxHistory used for rows with a trade date.
+    instruments is an optional instruments.InstrumentStore for rows with an ISIN.
+    A malformed trade date raises RowError, counting rows from first_row.
+    """
+    positions = {normalise_header(h): i for i, h in enumerate(header)}
+    columns = {name: column(positions, rows, name, number if name in NUMERIC_COLUMNS else label)
+               for name in COLUMNS}
+    if instruments is not None and ISIN in positions:
+        columns = instruments.fill(column(positions, rows, ISIN, label), columns)
+
+    # Currencies are matched in upper case, as fx_history does, so "usd" gets
+    # the USD rate with or without an FX history
+    currency = np.array([c.upper() if isinstance(c, str) else c for c in columns["issue_currency"]],
+                        dtype=object)
+
+    eur_rate = gbp_rate = trade_date = None
+    if TRADE_DATE in positions:
+        dates = []
+        for i, value in enumerate(column(positions, rows, TRADE_DATE, lambda value: value)):
+            try:
+                dates.append(parse_date(value))
+            except ValueError as exc:
+                raise RowError(first_row + i, f"{TRADE_DATE}: {exc}")
+        trade_date = np.array(dates, dtype="datetime64[D]")
+        dated = ~np.isnat(trade_date)
+        if fx is not None and dated.any():
+            # Undated rows (JSON lines and stream trades always have the
+            # column) keep the snapshot rates, as in a file without the column
+            eur_rate, gbp_rate = fx.cross_rates(currency, trade_date)
+            snapshot_eur, snapshot_gbp = deferral_engine.default_rates(currency, eur_xe, gbp_xe)
+            eur_rate = np.where(dated, eur_rate, snapshot_eur)
+            gbp_rate = np.where(dated, gbp_rate, snapshot_gbp)
+
+    return dict(
+        issue_currency=currency,
+        issue_size=np.array(columns["issue_size"], dtype=float),
+        trade_size=np.array(columns["trade_size"], dtype=float),
+        maturity=np.array(columns["maturity"], dtype=object),
+        issuer_country=np.array(columns["issuer_country"], dtype=object),
+        strip_inflation=np.array(columns["strip_inflation"], dtype=object),
+        rating=np.array(columns["rating"], dtype=object),
+        eur_rate=eur_rate, gbp_rate=gbp_rate, trade_date=trade_date,
+    )
+
+
+def classify_codes(header, rows, fx=None, workers=None, instruments=None, first_row=1):
+    """Classify a list of raw rows, returning {regime: outcome code array}.
+
+    fx, instruments and first_row are passed on to parse_chunk(). workers > 1
+    classifies large chunks on a process pool (see parallel.py).
+    """
+    return parallel.classify(**parse_chunk(header, rows, fx, instruments, first_row), workers=workers)
+
+
+def classify_chunk(header, rows, fx=None, workers=None, instruments=None, first_row=1):
+    """Classify a list of raw rows, returning {regime: list of messages}.
+
+    Takes the same arguments as classify_codes().
+    """
+    codes = classify_codes(header, rows, fx, workers, instruments, first_row)
+    return {regime: deferral_engine.messages(regime, codes[regime]).tolist()
+            for regime in RESULT_COLUMNS}
+
+
+def classify_file(src, dst, fmt, chunk_size=CHUNK_SIZE, progress=None, fx=None, workers=None,
+                  instruments=None):
+    """Stream src to dst with the deferral columns appended.
+
+    progress, if given, is called as progress(rows_done, total) after every
+    chunk. fx and instruments are passed on to classify_chunk(). With
+    workers > 1 (default parallel.WORKERS) each chunk holds chunk_size rows
+    per worker and is split across the process pool. Returns the number of
+    data rows written.
+    """
+    workers = parallel.WORKERS if workers is None else workers
+    header, rows, total = read_rows(src, fmt)
+    out_header = list(header) + list(RESULT_COLUMNS.values())
+
+    if fmt == "csv":
+        out = open(dst, "w", newline="", encoding="utf-8")
+        writer = csv.writer(out)
+        write = writer.writerow
+    else:
+        import openpyxl
+        out = openpyxl.Workbook(write_only=True)
+        ws = out.create_sheet()
+        write = ws.append
+
+    done = 0
+    try:
+        write(out_header)
+        for chunk in chunks(rows, chunk_size * max(workers, 1)):
+            results = classify_chunk(header, chunk, fx, workers, instruments, first_row=done + 1)
+            for i, row in enumerate(chunk):
+                write(list(row) + [results[regime][i] for regime in RESULT_COLUMNS])
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+    finally:
+        if fmt == "csv":
+            out.close()
+        else:
+            out.save(dst)
+    return done
+
+
+# Background jobs for the Dash upload
+
+def _job_dir(job_id):
+    if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+        raise ValueError("Invalid job id")
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def _write_status(job_id, **status):
+    path = os.path.join(_job_dir(job_id), "status.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp, path)
+
+
+def job_status(job_id):
+    try:
+        with open(os.path.join(_job_dir(job_id), "status.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def output_path(job_id):
+    status = job_status(job_id)
+    if not status or status["state"] != "done":
+        return None
+    return os.path.join(_job_dir(job_id), status["output"])
+
+
+def purge_jobs(ttl=None, now=None):
+    """Delete job directories not updated for ttl seconds (default JOB_TTL).
+
+    A running job rewrites its status after every chunk, so only finished,
+    failed or abandoned jobs expire. Returns the number removed.
+    """
+    ttl = JOB_TTL if ttl is None else ttl
+    now = time.time() if now is None else now
+    try:
+        names = os.listdir(JOBS_DIR)
+    except OSError:
+        return 0
+    removed = 0
+    for name in names:
+        try:
+            path = _job_dir(name)
+            # status.json is replaced on every update, which touches the directory
+            expired = now - os.path.getmtime(path) > ttl
+        except (ValueError, OSError):
+            continue
+        if expired:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def start_job(data, filename, chunk_size=CHUNK_SIZE, instruments=None):
+    """Save an uploaded file and classify it on a background thread.
+
+    instruments is passed on to classify_file(). Returns the job id used by
+    job_status() and output_path().
+    """
+    fmt = file_format(filename)
+    purge_jobs()
+    job_id = uuid.uuid4().hex
+    os.makedirs(_job_dir(job_id))
+    src = os.path.join(_job_dir(job_id), "input." + fmt)
+    with open(src, "wb") as f:
+        f.write(data)
+
+    stem = os.path.splitext(os.path.basename(filename))[0] or "blotter"
+    output = f"{stem}_deferrals.{fmt}"
+    _write_status(job_id, state="running", rows=0, total=None, output=output,
+                  started=time.time())
+
+    def run():
+        def progress(done, total):
+            _write_status(job_id, state="running", rows=done, total=total, output=output,
+                          started=started)
+
+        started = time.time()
+        try:
+            done = classify_file(src, os.path.join(_job_dir(job_id), output), fmt,
+                                 chunk_size=chunk_size, progress=progress, fx=fx_history.load(),
+                                 instruments=instruments)
+            _write_status(job_id, state="done", rows=done, total=done, output=output,
+                          started=started, seconds=time.time() - started)
+        except Exception as exc:
+            _write_status(job_id, state="error", error=str(exc), output=output,
+                          started=started)
+        finally:
+            os.remove(src)
+
+    threading.Thread(target=run, name=f"blotter-{job_id}", daemon=True).start()
+    return job_id
@@ -0,0 +1,200 @@
+"""
+Command line classifier for trade feeds.
+
+Reads CSV or JSON-lines trades from a file or stdin and writes them to stdout
+with the UK and EU deferral outcomes added. Records flow through a generator
+pipeline (read -> chunk -> classify -> write), so memory use stays constant
+however large the input is. Throughput is reported on stderr.
+
+    python classify_trades.py trades.csv > classified.csv
+    zcat archive.jsonl.gz | python classify_trades.py --format jsonl > out.jsonl
+    python classify_trades.py archive.csv --npz results.npz
+
+With --npz only the outcomes are kept, as compact integer codes in a columnar
+file (see outcome_codes.py), in the order of the input trades.
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+
+import blotter
+import fx_history
+import instruments
+import outcome_codes
+import parallel
+
+
+def read_csv(f):
+    reader = csv.reader(f)
+    header = next(reader, [])
+    return header, reader
+
+
+class InputError(ValueError):
+    """A line of the input that is not a trade."""
+
+
+def read_jsonl(f):
+    def rows():
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                raise InputError(f"line {number}: invalid JSON: {exc}")
+            if not isinstance(record, dict):
+                raise InputError(f"line {number}: expected a JSON object, got {type(record).__name__}")
+            yield record
+    return None, rows()
+
+
+def classified_csv(header, rows, chunk_size, fx=None, workers=1, store=None):
+    done = 0
+    for chunk in blotter.chunks(rows, chunk_size * workers):
+        results = blotter.classify_chunk(header, chunk, fx, workers, store, first_row=done + 1)
+        done += len(chunk)
+        for i, row in enumerate(chunk):
+            yield row + [results[regime][i] for regime in blotter.RESULT_COLUMNS]
+
+
+JSONL_HEADER = list(blotter.COLUMNS) + [blotter.TRADE_DATE, blotter.ISIN]
+
+
+def _jsonl_rows(records):
+    rows = []
+    for record in records:
+        fields = {blotter.normalise_header(k): v for k, v in record.items()}
+        rows.append([fields.get(name) for name in JSONL_HEADER])
+    return rows
+
+
+def classified_jsonl(records, chunk_size, fx=None, workers=1, store=None):
+    done = 0
+    for chunk in blotter.chunks(records, chunk_size * workers):
+        results = blotter.classify_chunk(JSONL_HEADER, _jsonl_rows(chunk), fx, workers, store,
+                                         first_row=done + 1)
+        done += len(chunk)
+        for i, record in enumerate(chunk):
+            for regime in blotter.RESULT_COLUMNS:
+                record[regime] = results[regime][i]
+            yield record
+
+
+def coded(header, rows, chunk_size, fx=None, workers=1, store=None):
+    """Outcome codes per chunk, for rows (CSV) or records (header None, JSON lines)."""
+    done = 0
+    for chunk in blotter.chunks(rows, chunk_size * workers):
+        if header is None:
+            codes = blotter.classify_codes(JSONL_HEADER, _jsonl_rows(chunk), fx, workers, store, done + 1)
+        else:
+            codes = blotter.classify_codes(header, chunk, fx, workers, store, done + 1)
+        done += len(chunk)
+        yield len(chunk), codes
+
+
+class Throughput:
+    """Counts records passing through and reports rows/sec on stderr."""
+
+    def __init__(self, every=5.0, stream=sys.stderr):
+        self.every = every
+        self.stream = stream
+        self.rows = 0
+        self.start = self.last = time.perf_counter()
+
+    def count(self, records, size=None):
+        """Pass records through, counting each as one row or as size(record) rows."""
+        check = 1000
+        for record in records:
+            self.rows += 1 if size is None else size(record)
+            yield record
+            if self.rows >= check and self.every:
+                check = self.rows + 1000
+                now = time.perf_counter()
+                if now - self.last >= self.every:
+                    self.last = now
+                    self.report()
+
+    def report(self):
+        seconds = time.perf_counter() - self.start
+        rate = self.rows / seconds if seconds else 0.0
+        print(f"{self.rows:,} rows in {seconds:.1f}s ({rate:,.0f} rows/sec)", file=self.stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify trades under the UK and EU deferral regimes.")
+    parser.add_argument("input", nargs="?", default="-", help="CSV or JSON-lines file (default: stdin)")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="input format (default: from the file extension, csv for stdin)")
+    parser.add_argument("--chunk-size", type=int, default=blotter.CHUNK_SIZE,
+                        help="trades classified per batch (default: %(default)s)")
+    parser.add_argument("--fx-history", default=fx_history.FX_HISTORY_FILE,
+                        help="CSV of dated EUR rates; trades with a trade_date column are converted "
+                             "at the rate on that date (default: $FX_HISTORY_FILE)")
+    parser.add_argument("--instruments", default=instruments.INSTRUMENTS_FILE,
+                        help="CSV of instrument reference data by ISIN; trades with an isin column only "
+                             "need a trade size (default: $INSTRUMENTS_FILE)")
+    parser.add_argument("--workers", type=int, default=parallel.WORKERS,
+                        help="processes classifying in parallel, each taking --chunk-size trades per batch "
+                             "(default: $DEFERRAL_WORKERS or 1)")
+    parser.add_argument("--npz", metavar="PATH",
+                        help="write only the outcomes, coded, to this .npz file instead of stdout "
+                             "(decode with outcome_codes.py)")
+    parser.add_argument("--progress-every", type=float, default=5.0,
+                        help="seconds between throughput reports on stderr, 0 to only report at the end")
+    args = parser.parse_args(argv)
+    args.workers = max(args.workers, 1)
+
+    fmt = args.format
+    if fmt is None:
+        fmt = "jsonl" if args.input.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+    if args.input == "-":
+        f = sys.stdin
+    else:
+        f = open(args.input, newline="", encoding="utf-8-sig")
+
+    fx = fx_history.load(args.fx_history) if args.fx_history else None
+    store = instruments.load(args.instruments) if args.instruments else None
+    throughput = Throughput(every=args.progress_every)
+    out = sys.stdout
+    try:
+        if args.npz:
+            header, rows = read_csv(f) if fmt == "csv" else read_jsonl(f)
+            with outcome_codes.ResultWriter(args.npz) as results:
+                chunks = coded(header, rows, args.chunk_size, fx, args.workers, store)
+                for _, codes in throughput.count(chunks, size=lambda chunk: chunk[0]):
+                    results.append(codes)
+        elif fmt == "csv":
+            header, rows = read_csv(f)
+            writer = csv.writer(out)
+            writer.writerow(header + list(blotter.RESULT_COLUMNS.values()))
+            writer.writerows(throughput.count(
+                classified_csv(header, rows, args.chunk_size, fx, args.workers, store)))
+        else:
+            _, records = read_jsonl(f)
+            for record in throughput.count(classified_jsonl(records, args.chunk_size, fx, args.workers, store)):
+                out.write(json.dumps(record))
+                out.write("\n")
+        out.flush()
+    except BrokenPipeError:
+        # Downstream closed the pipe (e.g. "| head"), nothing left to do
+        sys.stderr.close()
+        return 1
+    except (InputError, blotter.RowError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    throughput.report()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
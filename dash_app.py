@@ -0,0 +1,613 @@
+"""
+Dash app of the deferral checker: page layout, callbacks and Flask routes.
+
+Imported on first use through trade_checker (trade_checker.app,
+trade_checker.server, trade_checker.get_app()), so scripts that only need the
+rules never load Dash.
+"""
+
+import base64
+import hashlib
+import os
+
+import dash
+from dash import dcc, html, Input, Output, State
+from dash.exceptions import PreventUpdate
+import dash_bootstrap_components as dbc
+from flask import abort, request, send_file
+import plotly.graph_objects as go
+
+from api import api
+import blotter
+import deferral_cache
+import deferral_rules
+import instruments
+import metrics
+import volume_summary
+from fx_rates import eur_xe, gbp_xe
+from trade_checker import calculate_deferral_time_EU, country_options, currency_options
+
+# Initialize the Dash app. Pages are swapped in by display_page, so callbacks
+# refer to components that are not in the initial layout
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
+server = app.server
+server.register_blueprint(api)
+
+# Define layout
+checker_layout = dbc.Container([
+    # Title Card
+dbc.Row([
+    dbc.Col([
+        dbc.Card([
+            dbc.CardBody([
+                html.H1("ICMA bonds trade deferral checker", className="text-center", style={"font-weight": "bold"}),
+                html.P([
+                    html.Span("Instructions:", style={"font-weight": "bold"}), 
+                    f"Use the left card to calculate deferral times for Sovereign and Other Public Bond and the right one for Covered, Corporate, Convertible and Other Bonds.\n",
+                    html.Br(),
+                    f"\n Add all fields then click on the 'Calculate Deferral Time' buttons",
+                                    
+                ], className="text-center", style={"font-size": "20px"}),
+                html.P([
+                   html.Span("Disclaimer:", style={"font-weight": "bold"}),
+                   "This page is provided for information purposes only and should not be relied upon as legal, financial, or other professional advice. ",
+                   "ICMA does not represent or warrant that it is accurate or complete and neither ICMA nor its employees shall have any liability arising from or relating to the use of this page or its contents."
+
+               ], className="text-center", style={"font-size": "12px", "margin-top": "10px"}),
+                html.P(dcc.Link("Deferral analytics", href=app.get_relative_path('/analytics')), className="text-center")
+            ])
+        ], className="mb-4", style={'border': '1px solid #ccc', 'border-radius': '8px', 'padding': '20px', 'background-color': '#f8f9fa'})
+    ], width=12),
+], className="mb-4"),
+
+
+    dbc.Row([
+        # Left Column: Sovereign and Other Public Bond (Wrapped in a Box)
+        dbc.Col([
+            dbc.Card([
+                dbc.CardBody([
+                    html.H3("Sovereign and Other Public Bond"),
+
+                    html.Label("Is Strip or Inflation Linked?"),
+                    dcc.RadioItems(id='strip-inflation', options=[
+                        {'label': 'Yes', 'value': 'Yes'}, {'label': 'No', 'value': 'No'}
+                    ], value='No',inline=True),
+
+                    html.Label("Issuer Country"),
+                    dcc.Dropdown(id='issuer-country', options=country_options, placeholder="Select Country"),
+
+                    html.Br(),  # Adds a space between the rows
+
+                    html.Label("Issue Size Currency"),
+                    dcc.Dropdown(id='issue-currency', options=currency_options, placeholder="Select Currency"),
+
+                    html.Br(),  # Adds a space between the rows
+
+                    html.Label("Issue Size"),
+                    dcc.Input(id='issue-size', type='number', placeholder="Enter Issue Size"),
+
+                    html.Br(),  # Adds a space between the rows
+
+                    html.Label("Maturity"),
+                    dcc.Dropdown(id='maturity-dropdown', options=[
+                        {'label': '<5 years', 'value': '<5'},
+                        {'label': '5-15 years', 'value': '5-15'},
+                        {'label': '>15 years', 'value': '>15'}
+                    ], placeholder="Select Maturity"),
+
+                    html.Br(),  # Adds a space between the rows
+
+                    html.Label("Trade Size (in the same currency of issue currency)"),
+                    dcc.Input(id='trade-size', type='number', placeholder="Enter Trade Size"),
+                    
+                    html.Br(),
+                    
+                    
+                    dbc.Button("Calculate Deferral Time", id="calculate-button", color="primary", className="mt-3"),
+                    
+                    # Output for the original calculation
+                    html.Div(id='output-result', className="mt-3"),
+
+                    # Output for the new EU deferral time calculation
+                    html.Div(id='output-result-2', className="mt-3"),
+                    
+                    html.Div(id='output-result-3', className="mt-3")
+
+                ])
+            ], className="mb-4", style={'border': '1px solid #ccc', 'border-radius': '8px', 'padding': '20px'}),  # Border and Padding
+        ], width=6),
+
+        # Right Column: (No Changes)
+        dbc.Col([
+            dbc.Card([
+                dbc.CardBody([
+                    html.H3("Covered, Corporate, Convertible and Other Bonds"),
+
+                    html.Label("Issue Size Currency"),
+                    dcc.Dropdown(id='issue-currency-2', options=currency_options, placeholder="Select Currency"),
+
+                    html.Br(),  # Adds a space between the rows
+
+                    html.Label("Issue Size"),
+                    dcc.Input(id='issue-size-2', type='number', placeholder="Enter Issue Size"),
+
+                    html.Br(), # Adds a space between the rows
+
+                    html.Label("Rating"),
+                    
+                    dcc.Dropdown(id='rating-dropdown', options=[
+                        {'label': 'Investment Grade (IG)', 'value': 'IG'},
+                        {'label': 'High Yield (HY)', 'value': 'HY'}
+                    ], placeholder="Select Rating"),
+
+                    html.Br(),  # Adds a space between the rows
+
+                    html.Label("Trade Size (in the same currency of issue currency)"),
+                    dcc.Input(id='trade-size-2', type='number', placeholder="Enter Trade Size"),
+                    html.Br(),
+                    dbc.Button("Calculate Deferral Times", id="calculate-deferral-button", color="primary", className="mt-3"),
+
+                    
+                    html.Div(id='deferral-output-1', className="mt-3"),  # First output: Dynamic message
+                    html.Div(id='deferral-output-2', className="mt-3"),  # Second output: Dynamic message
+                    html.Div(id='deferral-output-3', className="mt-3")   # Third output: Static message
+
+                ])
+            ], className="mb-4", style={'border': '1px solid #ccc', 'border-radius': '8px', 'padding': '20px'}),  # Border and Padding
+        ], width=6),
+
+    ], className="mb-4"),
+
+    # Deferral ladder: every trade size breakpoint of one issue at once
+    dbc.Row([
+        dbc.Col([
+            dbc.Card([
+                dbc.CardBody([
+                    html.H3("Deferral Ladder"),
+                    html.P("Shows the trade sizes, in the issue currency, at which the UK and EU deferrals change for one issue."),
+
+                    dbc.Row([
+                        dbc.Col([
+                            html.Label("Issue Size Currency"),
+                            dcc.Dropdown(id='ladder-currency', options=currency_options, placeholder="Select Currency"),
+                        ], width=2),
+                        dbc.Col([
+                            html.Label("Issue Size"),
+                            dcc.Input(id='ladder-issue-size', type='number', placeholder="Enter Issue Size"),
+                        ], width=2),
+                        dbc.Col([
+                            html.Label("Issuer Country"),
+                            dcc.Dropdown(id='ladder-country', options=country_options, placeholder="Select Country"),
+                        ], width=2),
+                        dbc.Col([
+                            html.Label("Maturity"),
+                            dcc.Dropdown(id='ladder-maturity', options=[
+                                {'label': '<5 years', 'value': '<5'},
+                                {'label': '5-15 years', 'value': '5-15'},
+                                {'label': '>15 years', 'value': '>15'}
+                            ], placeholder="Select Maturity"),
+                        ], width=2),
+                        dbc.Col([
+                            html.Label("Is Strip or Inflation Linked?"),
+                            dcc.RadioItems(id='ladder-strip-inflation', options=[
+                                {'label': 'Yes', 'value': 'Yes'}, {'label': 'No', 'value': 'No'}
+                            ], value='No', inline=True),
+                        ], width=2),
+                        dbc.Col([
+                            html.Label("Rating"),
+                            dcc.Dropdown(id='ladder-rating', options=[
+                                {'label': 'Investment Grade (IG)', 'value': 'IG'},
+                                {'label': 'High Yield (HY)', 'value': 'HY'}
+                            ], placeholder="Select Rating"),
+                        ], width=2),
+                    ]),
+
+                    dbc.Button("Show Deferral Ladder", id="ladder-button", color="primary", className="mt-3"),
+                    html.Div(id='ladder-output', className="mt-3")
+                ])
+            ], className="mb-4", style={'border': '1px solid #ccc', 'border-radius': '8px', 'padding': '20px'}),
+        ], width=12),
+    ], className="mb-4"),
+
+    # Bulk blotter upload
+    dbc.Row([
+        dbc.Col([
+            dbc.Card([
+                dbc.CardBody([
+                    html.H3("Bulk Blotter Upload"),
+                    html.P([
+                        "Upload a .csv or .xlsx file with one trade per row. Recognised columns: ",
+                        html.Code(", ".join(blotter.COLUMNS)),
+                        " and optionally ", html.Code(f"{blotter.TRADE_DATE}, {blotter.ISIN}"),
+                        ". The file is returned with the UK and EU deferral columns appended."
+                    ]),
+
+                    dcc.Upload(id='blotter-upload', children=html.Div([
+                        "Drag and drop or ", html.A("select a trade file")
+                    ]), accept=".csv,.txt,.xlsx,.xlsm", style={
+                        'border': '1px dashed #999', 'border-radius': '8px',
+                        'padding': '20px', 'text-align': 'center'}),
+
+                    dbc.Progress(id='blotter-progress', value=0, className="mt-3", style={'height': '20px'}),
+                    html.Div(id='blotter-status', className="mt-3"),
+
+                    dcc.Store(id='blotter-job'),
+                    dcc.Interval(id='blotter-interval', interval=1000, disabled=True)
+                ])
+            ], className="mb-4", style={'border': '1px solid #ccc', 'border-radius': '8px', 'padding': '20px'}),
+        ], width=12),
+    ], className="mb-4"),
+
+    dbc.Row([
+    dbc.Col([
+        dbc.Card([
+            dbc.CardBody([
+                html.H4("Contact Us"),
+                html.P(
+                    "For questions, to submit a bug, or to contact us, please email data@icmagroup.org or call +44 20 7213 0312."
+                ),
+                html.P([
+                   html.Span("© International Capital Market Association (ICMA), Zurich, 2024. All rights reserved.:", style={"font-weight": "bold"}),
+                   
+
+               ], className="mb4", style={"font-size": "12px", "margin-top": "10px"})
+                
+            ])
+        ], className="mb-4", style={'border': '1px solid #ccc', 'border-radius': '8px', 'padding': '20px'}),
+    ], width=12),
+], className="mb-4")
+    
+], fluid=True,
+    
+
+    )
+
+app.layout = html.Div([
+    dcc.Location(id='url', refresh=False),
+    html.Div(id='page-content')
+])
+
+
+def analytics_layout():
+    # Built on each visit so newly saved summaries are listed
+    summaries = [name for name, _ in volume_summary.saved()]
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.H1("Deferral analytics", className="text-center", style={"font-weight": "bold"}),
+                        html.P("Share of traded volume published in real time or after each deferral period, "
+                               "per regime and asset class. Charts are drawn from saved summaries "
+                               "(python volume_summary.py blotter.csv), never from the raw trades.",
+                               className="text-center"),
+                        html.P(dcc.Link("Back to the deferral checker", href=app.get_relative_path('/')),
+                               className="text-center")
+                    ])
+                ], className="mb-4", style={'border': '1px solid #ccc', 'border-radius': '8px', 'padding': '20px', 'background-color': '#f8f9fa'})
+            ], width=12),
+        ], className="mb-4"),
+
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        dbc.Row([
+                            dbc.Col([
+                                html.Label("Summary"),
+                                dcc.Dropdown(id='analytics-summary', options=[{'label': n, 'value': n} for n in summaries],
+                                             value=summaries[0] if summaries else None, placeholder="No summaries saved yet"),
+                            ], width=6),
+                            dbc.Col([
+                                html.Label("Measure"),
+                                dcc.RadioItems(id='analytics-measure', options=[
+                                    {'label': label, 'value': value} for value, label in volume_summary.MEASURES.items()
+                                ], value='volume', inline=True),
+                            ], width=3),
+                            dbc.Col([
+                                html.Label("Deferral of"),
+                                dcc.RadioItems(id='analytics-by', options=[
+                                    {'label': 'Price', 'value': 'price'}, {'label': 'Volume', 'value': 'volume'}
+                                ], value='price', inline=True),
+                            ], width=3),
+                        ]),
+                        dcc.Graph(id='analytics-chart', config={'displaylogo': False}),
+                        html.Div(id='analytics-info', className="mt-3")
+                    ])
+                ], className="mb-4", style={'border': '1px solid #ccc', 'border-radius': '8px', 'padding': '20px'}),
+            ], width=12),
+        ], className="mb-4"),
+    ], fluid=True)
+
+
+@app.callback(Output('page-content', 'children'), [Input('url', 'pathname')])
+def display_page(pathname):
+    if app.strip_relative_path(pathname) == 'analytics':
+        return analytics_layout()
+    return checker_layout
+
+
+# Result templates. Flags are served from assets/ with a content hash in the
+# URL, so browsers can cache them indefinitely (see add_asset_cache_headers)
+def fingerprinted_asset(path):
+    with open(os.path.join(app.config.assets_folder, path), 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:10]
+    return f"{app.get_asset_url(path)}?v={digest}"
+
+
+UK_FLAG = fingerprinted_asset('flags/uk.svg')
+EU_FLAG = fingerprinted_asset('flags/eu.svg')
+
+_rendered = deferral_cache.cache("rendered", maxsize=256)
+
+
+def _flag_message(key):
+    flag, text = key
+    return html.Div([
+        html.Img(src=flag, style={'height': '20px', 'width': 'auto'}),
+        html.Span(text)
+    ])
+
+
+def flag_message(flag, message):
+    # There are only a few dozen distinct results, each is built once
+    return _rendered.get((flag, f" {message}"), _flag_message)
+
+
+EU_DMO_MESSAGE = _flag_message((EU_FLAG, "Depending on specific DMO, trade might be eligible for a 6 months deferral"))
+
+
+@server.after_request
+def add_asset_cache_headers(response):
+    if request.path.startswith(app.get_asset_url('')) and request.args.get('v'):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def result_text(result):
+    # Message shown by a callback output: a plain string or a flag_message Div
+    if isinstance(result, str):
+        return result
+    return result.children[-1].children.strip()
+
+
+@server.route('/metrics')
+def prometheus_metrics():
+    if not metrics.ENABLED:
+        abort(404)
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+# Callback to handle both the original deferral time logic and the new EU deferral time logic
+@app.callback(
+    [Output('output-result', 'children'),  # First message output
+     Output('output-result-2', 'children'),
+     Output('output-result-3', 'children')],  
+    [
+        Input('calculate-button', 'n_clicks')
+    ],
+    [
+        State('strip-inflation', 'value'),
+        State('issuer-country', 'value'),
+        State('issue-currency', 'value'),
+        State('issue-size', 'value'),
+        State('maturity-dropdown', 'value'),
+        State('trade-size', 'value')
+    ]
+)
+# The EU output is counted by calculate_deferral_time_EU itself
+@metrics.instrument("calculate_deferral_time", ["uk_sovereign", None, None], text=result_text)
+def calculate_deferral_time(n_clicks, strip_inflation, issuer_country, issue_currency, issue_size, maturity, trade_size):
+    if issue_size is None or trade_size is None:
+        return "Please fill all fields then click Calculate.", "",""
+
+    # Convert Issue Size and Trade Size into EUR and GBP
+    issue_size_eur = issue_size * eur_xe.get(issue_currency, 1)
+    issue_size_gbp = issue_size * gbp_xe.get(issue_currency, 1)
+    trade_size_eur = trade_size * eur_xe.get(issue_currency, 1)
+    trade_size_gbp = trade_size * gbp_xe.get(issue_currency, 1)
+    
+    # UK deferral, looked up in the sovereign threshold tables (GBP)
+    outcome = deferral_rules.uk_sovereign(issue_size_gbp, trade_size_gbp, maturity, issuer_country, strip_inflation)
+    if outcome is None:
+        # The published ladders do not cover this combination (e.g. no maturity selected)
+        raise PreventUpdate
+    message = deferral_rules.message("uk_sovereign", outcome)
+
+    # Calculate the second message using the EU logic
+    eu_message = calculate_deferral_time_EU(issue_size_eur, trade_size_eur)
+
+    # Return both messages with their flags, plus the constant DMO note
+    return flag_message(UK_FLAG, message), flag_message(EU_FLAG, eu_message), EU_DMO_MESSAGE
+
+
+@app.callback(
+    [Output('deferral-output-1', 'children'),  # First output: Deferral Time based on GBP
+     Output('deferral-output-2', 'children'),  # Second output: Deferral Time based on EUR
+     Output('deferral-output-3', 'children')],  # Third output: Static output
+    [
+        Input('calculate-deferral-button', 'n_clicks')
+    ],
+    [
+        State('issue-currency-2', 'value'),
+        State('issue-size-2', 'value'),
+        State('trade-size-2', 'value'),
+        State('rating-dropdown', 'value')
+    ]
+)
+@metrics.instrument("calculate_deferral_times", ["uk_corporate", "eu_corporate", "eu_covered"], text=result_text)
+def calculate_deferral_times(n_clicks, issue_currency, issue_size, trade_size, rating):
+    if not n_clicks:
+        return "Please fill all fields then click Calculate.", "", ""  # No button click yet, so return empty strings
+    
+    if issue_size is None or trade_size is None or issue_currency is None or rating is None:
+        return "Please fill all fields then click Calculate.", "", ""  # Return error message if fields are missing
+    
+    # Convert Issue Size and Trade Size into EUR and GBP
+    issue_size_eur = issue_size * eur_xe.get(issue_currency, 1)
+    issue_size_gbp = issue_size * gbp_xe.get(issue_currency, 1)
+    trade_size_eur = trade_size * eur_xe.get(issue_currency, 1)
+    trade_size_gbp = trade_size * gbp_xe.get(issue_currency, 1)
+
+    # Calculate the first output (based on GBP logic and rating)
+    outcome = deferral_rules.uk_corporate(issue_size_gbp, trade_size_gbp, issue_currency, rating)
+    if outcome is None:
+        raise PreventUpdate
+    deferral_1 = deferral_rules.message("uk_corporate", outcome)
+
+    # Calculate the second output (based on EUR logic)
+    deferral_2 = deferral_rules.message("eu_corporate", deferral_rules.eu("eu_corporate", issue_size_eur, trade_size_eur))
+
+    # Calculate the 3rd output (based on EUR logic)
+    deferral_3 = deferral_rules.message("eu_covered", deferral_rules.eu("eu_covered", issue_size_eur, trade_size_eur))
+
+    # Return all three outputs
+    return flag_message(UK_FLAG, deferral_1), flag_message(EU_FLAG, deferral_2), flag_message(EU_FLAG, deferral_3)
+
+
+LADDER_TITLES = {
+    "uk_sovereign": (UK_FLAG, "UK (sovereign)"),
+    "eu_sovereign": (EU_FLAG, "EU (sovereign)"),
+    "uk_corporate": (UK_FLAG, "UK (corporate)"),
+    "eu_corporate": (EU_FLAG, "EU (corporate, convertible and other bonds)"),
+    "eu_covered": (EU_FLAG, "EU (covered bonds only)"),
+}
+
+
+def ladder_table(regime, table, currency):
+    flag, title = LADDER_TITLES[regime]
+    header = html.H5([html.Img(src=flag, style={'height': '20px', 'width': 'auto'}), f" {title}"], className="mt-3")
+    if not table['bands']:
+        return html.Div([header, html.P("Not defined for this issue, please fill all fields.")])
+    rows = []
+    bands = table['bands']
+    for band, upper in zip(bands, bands[1:] + [None]):
+        if band['from'] is None and upper is None:
+            size = "Any size"
+        elif band['from'] is None:
+            size = f"{'Below' if upper['inclusive'] else 'Up to'} {upper['from']:,.0f} {currency}"
+        else:
+            size = f"{'From' if band['inclusive'] else 'Above'} {band['from']:,.0f} {currency}"
+        rows.append(html.Tr([html.Td(size), html.Td(deferral_rules.message(regime, band['outcome']) or "Not defined")]))
+    return html.Div([header, dbc.Table([html.Thead(html.Tr([html.Th("Trade size"), html.Th("Deferral")])),
+                                        html.Tbody(rows)], bordered=True, size="sm")])
+
+
+@app.callback(
+    Output('ladder-output', 'children'),
+    [
+        Input('ladder-button', 'n_clicks')
+    ],
+    [
+        State('ladder-currency', 'value'),
+        State('ladder-issue-size', 'value'),
+        State('ladder-country', 'value'),
+        State('ladder-maturity', 'value'),
+        State('ladder-strip-inflation', 'value'),
+        State('ladder-rating', 'value')
+    ]
+)
+def show_ladder(n_clicks, issue_currency, issue_size, issuer_country, maturity, strip_inflation, rating):
+    if not n_clicks:
+        raise PreventUpdate
+    if issue_currency is None or issue_size is None:
+        return "Please select the issue currency and enter the issue size."
+    ladders = deferral_rules.issue_ladders(issue_currency, issue_size, maturity, issuer_country,
+                                           strip_inflation, rating)
+    return dbc.Row([
+        dbc.Col([ladder_table(regime, ladders[regime], issue_currency) for regime in ("uk_sovereign", "eu_sovereign")], width=6),
+        dbc.Col([ladder_table(regime, ladders[regime], issue_currency)
+                 for regime in ("uk_corporate", "eu_corporate", "eu_covered")], width=6),
+    ])
+
+
+# Bulk blotter upload: the file is classified on a background thread and the
+# page polls the job status until the result can be downloaded
+@app.callback(
+    [Output('blotter-job', 'data'),
+     Output('blotter-interval', 'disabled'),
+     Output('blotter-progress', 'value'),
+     Output('blotter-progress', 'label'),
+     Output('blotter-status', 'children')],
+    [
+        Input('blotter-upload', 'contents'),
+        Input('blotter-interval', 'n_intervals')
+    ],
+    [
+        State('blotter-upload', 'filename'),
+        State('blotter-job', 'data')
+    ]
+)
+def blotter_upload(contents, n_intervals, filename, job_id):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+
+    if 'blotter-upload.contents' in triggered:
+        if contents is None:
+            raise PreventUpdate
+        try:
+            data = base64.b64decode(contents.split(',', 1)[1])
+            job_id = blotter.start_job(data, filename, instruments=instruments.load())
+        except ValueError as exc:
+            return None, True, 0, "", dbc.Alert(str(exc), color="danger")
+        return job_id, False, 0, "", f"Classifying {filename}..."
+
+    if not job_id:
+        raise PreventUpdate
+
+    status = blotter.job_status(job_id)
+    if status is None:
+        return None, True, 0, "", dbc.Alert("Upload not found, please upload the file again.", color="danger")
+    if status['state'] == 'error':
+        return job_id, True, 0, "", dbc.Alert(f"Could not classify the file: {status['error']}", color="danger")
+    if status['state'] == 'done':
+        link = html.A(f"Download {status['output']}", href=app.get_relative_path(f"/blotter/{job_id}/download"))
+        return job_id, True, 100, "100%", html.Div([f"{status['rows']:,} trades classified. ", link])
+
+    total = status.get('total')
+    pct = int(100 * status['rows'] / total) if total else 0
+    return job_id, False, pct, f"{pct}%", f"{status['rows']:,} trades classified..."
+
+
+@server.route('/blotter/<job_id>/download')
+def blotter_download(job_id):
+    try:
+        path = blotter.output_path(job_id)
+    except ValueError:
+        path = None
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=blotter.job_status(job_id)['output'])
+
+
+@app.callback(
+    [Output('analytics-chart', 'figure'),
+     Output('analytics-info', 'children')],
+    [
+        Input('analytics-summary', 'value'),
+        Input('analytics-measure', 'value'),
+        Input('analytics-by', 'value')
+    ]
+)
+def analytics_chart(name, measure, by):
+    path = dict(volume_summary.saved()).get(name)
+    if path is None:
+        return go.Figure(), "Summarise a blotter with volume_summary.py to see its deferral distribution here."
+    summary = volume_summary.load(path)
+    shares = summary.distribution(measure, by)
+    regimes = list(blotter.RESULT_COLUMNS)
+    titles = [LADDER_TITLES[regime][1] for regime in regimes]
+
+    figure = go.Figure()
+    for period, label in volume_summary.PERIODS.items():
+        values = [100 * shares[regime][period] for regime in regimes]
+        if any(values):
+            figure.add_trace(go.Bar(name=label, y=titles, x=values, orientation='h',
+                                    hovertemplate=f"{label}: %{{x:.1f}}%<extra></extra>"))
+    figure.update_layout(barmode='stack', xaxis={'title': f"{volume_summary.MEASURES[measure]} (%)", 'range': [0, 100]},
+                         yaxis={'autorange': 'reversed'}, legend={'title': f"{by.title()} deferral"},
+                         margin={'l': 10, 'r': 10, 't': 30, 'b': 10}, height=420)
+
+    volume = summary.volume[0].sum()
+    info = (f"{summary.rows:,} trades, EUR {volume:,.0f} notional, from {summary.source or name}"
+            f" (created {summary.created}, rules {summary.rules_version}).")
+    return figure, info
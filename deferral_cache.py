@@ -0,0 +1,81 @@
+"""
+Bounded LRU caches for values that are expensive to rebuild.
+
+The batch engine's compiled tables (per rules version), the per-issue
+deferral ladders (per rules version, rates and segments) and the Dash
+result components are kept in named caches here. Keys are normalised so that
+every trade or issue that would produce the same value shares one entry.
+Per-trade outcomes are not cached: a band lookup is a bisect on a handful of
+edges, cheaper than any cache lookup.
+
+All caches are cleared by invalidate(), which deferral_rules calls when the
+thresholds or the fx_rates tables change and fx_history calls when a rate
+history is rebuilt. stats() reports hits, misses, evictions and
+invalidations per cache.
+"""
+
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 4096
+
+
+class BucketCache:
+    """Thread-safe LRU mapping with hit/miss/eviction counters."""
+
+    def __init__(self, name, maxsize=DEFAULT_MAXSIZE):
+        self.name = name
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key, compute):
+        """Cached value for key, calling compute(key) on a miss."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        value = compute(key)
+        with self._lock:
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations}
+
+
+_caches = {}
+
+
+def cache(name, maxsize=DEFAULT_MAXSIZE):
+    """The named cache, created on first use."""
+    c = _caches.get(name)
+    if c is None:
+        c = _caches.setdefault(name, BucketCache(name, maxsize))
+    return c
+
+
+def invalidate():
+    for c in list(_caches.values()):
+        c.clear()
+
+
+def stats():
+    return {name: c.stats() for name, c in _caches.items()}
@@ -0,0 +1,317 @@
+"""
+Vectorised deferral classification for whole blotters.
+
+The functions here take arrays of trades (one value per trade, or a scalar
+shared by every trade) and return integer outcome codes for the UK sovereign,
+UK corporate, EU sovereign, EU corporate and EU covered regimes in one call.
+Codes index into deferral_rules.OUTCOMES and map back to exactly the strings
+returned by the Dash callbacks in trade_checker.py via messages().
+
+The breakpoint ladders come from deferral_rules: each regime's segments are
+compiled into a matrix of edges and a matrix of outcome codes, so a whole
+column of trades is classified with array comparisons and a table lookup
+instead of walking the ladders row by row.
+
+When the rules file holds several versions, trades with a trade date are
+grouped by the version in force on that date and each group is classified in
+one pass with that version's tables (by_rule_version()).
+"""
+
+import math
+import operator
+
+import numpy as np
+
+import deferral_cache
+import deferral_rules
+from deferral_rules import OUTCOME_CODES, OUTCOMES, REGIMES
+from fx_rates import eur_xe, gbp_xe
+
+NO_OUTCOME = OUTCOME_CODES[None]
+
+
+class Tables:
+    """NumPy form of a deferral_rules.RuleSet.
+
+    For every regime, segment i has edges[i] (padded with +inf) and codes[i]
+    (outcome code per band). A final extra segment with no outcome is used for
+    segment names the rules do not define (e.g. a liquid gilt with no maturity).
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.index = {}
+        self.edges = {}
+        self.codes = {}
+        self.has_edges = {}
+        self.fallback = {}
+        for regime in REGIMES:
+            ladders = [rules.ladders[regime, name] for name in rules.segments(regime)]
+            width = max(len(ladder.edges) for ladder in ladders)
+            edges = np.full((len(ladders) + 1, width), math.inf)
+            codes = np.full((len(ladders) + 1, width + 1), NO_OUTCOME, dtype=np.int8)
+            for i, ladder in enumerate(ladders):
+                edges[i, :len(ladder.edges)] = ladder.edges
+                codes[i, :len(ladder.outcomes)] = [OUTCOME_CODES[o] for o in ladder.outcomes]
+                codes[i, len(ladder.outcomes):] = OUTCOME_CODES[ladder.outcomes[-1]]
+            self.index[regime] = {name: i for i, name in enumerate(rules.segments(regime))}
+            self.edges[regime] = edges
+            self.codes[regime] = codes
+            self.has_edges[regime] = np.array([bool(ladder.edges) for ladder in ladders] + [False])
+            self.fallback[regime] = OUTCOME_CODES[rules[regime].get("fallback")]
+
+    def segment(self, regime, name):
+        return self.index[regime].get(name, len(self.index[regime]))
+
+    def ladder(self, regime, trade_size, segment):
+        # One comparison per ladder column keeps memory at the size of the
+        # trades rather than trades x edges
+        band = np.zeros(np.shape(trade_size), dtype=np.int8)
+        for column in self.edges[regime].T:
+            band += trade_size > column[segment]
+        codes = np.asarray(self.codes[regime][segment, band])
+        codes[np.isnan(trade_size) & self.has_edges[regime][segment]] = self.fallback[regime]
+        return codes
+
+
+# Compiled tables per rules version, in the shared caches so they are
+# dropped together with the scalar lookups when thresholds or FX change
+_tables_cache = deferral_cache.cache("engine_tables", maxsize=32)
+
+
+def tables(rules=None):
+    """Compiled tables for the given (default: current) rules, cached."""
+    rules = rules or deferral_rules.current()
+    return _tables_cache.get(rules.version, lambda version: Tables(rules))
+
+
+def rule_versions(history, trade_date):
+    """Position in history.rule_sets of the version in force on each trade date.
+
+    trade_date is a datetime64[D] array (or anything numpy converts to one);
+    undated trades (NaT) get the version in force today.
+    """
+    dates = np.asarray(trade_date, dtype="datetime64[D]")
+    starts = np.array(history.starts[1:], dtype="datetime64[D]")
+    version = np.searchsorted(starts, dates, side="right")
+    undated = np.isnat(dates)
+    if undated.any():
+        version = np.where(undated, history.index(), version)
+    return version
+
+
+def by_rule_version(classify, trade_date, **columns):
+    """Call classify(rules=..., **columns) once per rules version in use.
+
+    Each group of trades sharing a version is classified in one vectorised
+    pass and the codes are scattered back into trade order. Columns that are
+    None or scalars are passed through as they are.
+    """
+    history = deferral_rules.history()
+    if len(history) == 1:
+        return classify(rules=history.rule_sets[0], **columns)
+    version = rule_versions(history, trade_date)
+    used = np.unique(version)
+    if len(used) == 1:
+        return classify(rules=history.rule_sets[used[0]], **columns)
+
+    n = len(version)
+    columns = {name: values if values is None or np.ndim(values) == 0 else np.asarray(values)
+               for name, values in columns.items()}
+    result = {regime: np.empty(n, dtype=np.int8) for regime in REGIMES}
+    for v in used:
+        rows = np.flatnonzero(version == v)
+        codes = classify(rules=history.rule_sets[v],
+                         **{name: values if values is None or np.ndim(values) == 0 else values[rows]
+                            for name, values in columns.items()})
+        for regime in REGIMES:
+            result[regime][rows] = codes[regime]
+    return result
+
+
+def labels(values):
+    """A text column as the engine compares it: fixed width strings.
+
+    None and NaN simply become values that match nothing.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'U':
+        return values
+    return values.astype(object).astype(str)
+
+
+def encode(values):
+    """Integer codes for a text column: (codes, distinct).
+
+    distinct holds the column's distinct values as labels() compares them,
+    and codes, shaped like values, index into it. Object columns (as parsed
+    from files and JSON) are hashed in one pass rather than converted to
+    strings and sorted, so only the distinct values are converted.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'O':
+        items = values.ravel().tolist()
+        try:
+            index = dict.fromkeys(items)
+        except TypeError:
+            pass  # unhashable values, sorted below
+        else:
+            for i, value in enumerate(index):
+                index[value] = i
+            if len(items) > 1:
+                codes = np.fromiter(operator.itemgetter(*items)(index), dtype=np.int32, count=len(items))
+            else:
+                codes = np.array([index[value] for value in items], dtype=np.int32)
+            return codes.reshape(values.shape), np.array([str(value) for value in index], dtype=str)
+    text = labels(values)
+    distinct, codes = np.unique(text, return_inverse=True)
+    return codes.reshape(text.shape).astype(np.int32), distinct
+
+
+def default_rates(currency, *tables):
+    """Rate of each trade's currency in each of the fx_rates tables given (1 if missing)."""
+    codes, distinct = encode(currency)
+    return [np.array([table.get(c, 1) for c in distinct], dtype=float)[codes]
+            for table in tables]
+
+
+def _segment_index(t, regime, distinct, name):
+    # Segment index of each distinct value, for segments named after it
+    return np.array([t.segment(regime, name.format(u)) for u in distinct], dtype=np.intp)
+
+
+# Per-trade values that depend on a single text column: each is looked up
+# for the column's distinct values once (lookups()) and gathered by code.
+# The default eur_rate/gbp_rate are looked up the same way by issue_currency.
+DERIVED = {
+    "liquid_currency": "issue_currency",
+    "liquid_country": "issuer_country",
+    "conventional": "strip_inflation",
+    "tenor": "maturity",
+    "graded": "rating",
+}
+
+LABEL_COLUMNS = ("issue_currency", "maturity", "issuer_country", "strip_inflation", "rating")
+
+
+def lookups(t, distinct):
+    """{name: value per distinct value of its column} for DERIVED and the rates.
+
+    distinct is {column: distinct values} as returned by encode(). Rates are
+    from the fx_rates tables.
+    """
+    currency = distinct["issue_currency"]
+    return {
+        "eur_rate": np.array([eur_xe.get(c, 1) for c in currency], dtype=float),
+        "gbp_rate": np.array([gbp_xe.get(c, 1) for c in currency], dtype=float),
+        "liquid_currency": np.isin(currency, t.rules["uk_corporate"]["liquid_currencies"]),
+        "liquid_country": np.isin(distinct["issuer_country"], t.rules["uk_sovereign"]["liquid_countries"]),
+        "conventional": distinct["strip_inflation"] == 'No',
+        "tenor": _segment_index(t, "uk_sovereign", distinct["maturity"], "liquid {}"),
+        "graded": _segment_index(t, "uk_corporate", distinct["rating"], "rating {}"),
+    }
+
+
+def uk_sovereign(t, issue_size_gbp, trade_size_gbp, liquid, tenor):
+    spec = t.rules["uk_sovereign"]
+    segment = np.where(np.isnan(issue_size_gbp), t.segment("uk_sovereign", "unknown issue size"),
+                       np.where(issue_size_gbp >= spec["issue_size_threshold"],
+                                np.where(liquid, tenor, t.segment("uk_sovereign", "other")),
+                                t.segment("uk_sovereign", "small")))
+    return t.ladder("uk_sovereign", trade_size_gbp, segment)
+
+
+def uk_corporate(t, issue_size_gbp, trade_size_gbp, liquid_currency, graded):
+    spec = t.rules["uk_corporate"]
+    large = (issue_size_gbp >= spec["issue_size_threshold"]) & liquid_currency
+    segment = np.where(np.isnan(issue_size_gbp), t.segment("uk_corporate", "unknown issue size"),
+                       np.where(large, graded, t.segment("uk_corporate", "other")))
+    return t.ladder("uk_corporate", trade_size_gbp, segment)
+
+
+def eu(t, regime, issue_size_eur, trade_size_eur):
+    threshold = t.rules[regime]["issue_size_threshold"]
+    segment = np.where(np.isnan(issue_size_eur), t.segment(regime, "unknown issue size"),
+                       np.where(issue_size_eur >= threshold,
+                                t.segment(regime, "large"), t.segment(regime, "small")))
+    return t.ladder(regime, trade_size_eur, segment)
+
+
+def classify(issue_currency, issue_size, trade_size, maturity=None, issuer_country=None,
+             strip_inflation=None, rating=None, eur_rate=None, gbp_rate=None, rules=None,
+             trade_date=None):
+    """Classify a batch of trades under every regime.
+
+    All arguments are array-likes of equal length (or scalars applied to every
+    trade). Sizes are in the issue currency; missing sizes should be NaN.
+    eur_rate/gbp_rate override the fx_rates tables when given. Trades are
+    classified under the rules given, else under the version in force on their
+    trade_date, else today's. Returns a dict of regime -> int8 code array, see
+    messages() for the matching strings.
+    """
+    if rules is None and trade_date is not None:
+        return by_rule_version(classify, trade_date, issue_currency=issue_currency, issue_size=issue_size,
+                               trade_size=trade_size, maturity=maturity, issuer_country=issuer_country,
+                               strip_inflation=strip_inflation, rating=rating,
+                               eur_rate=eur_rate, gbp_rate=gbp_rate)
+    t = tables(rules)
+    labels = {"issue_currency": issue_currency, "maturity": maturity, "issuer_country": issuer_country,
+              "strip_inflation": strip_inflation, "rating": rating}
+    encoded = {name: encode(values) for name, values in labels.items()}
+    return classify_codes(t, {name: codes for name, (codes, _) in encoded.items()},
+                          lookups(t, {name: distinct for name, (_, distinct) in encoded.items()}),
+                          issue_size, trade_size, eur_rate, gbp_rate)
+
+
+def classify_codes(t, codes, lookups, issue_size, trade_size, eur_rate=None, gbp_rate=None):
+    """classify() for text columns already encoded.
+
+    codes is {column in LABEL_COLUMNS: codes} and lookups the matching
+    lookups(), so the text columns only cost integer gathers here (see
+    parallel.py). Rates default to the looked up fx_rates.
+    """
+    derived = {name: lookups[name][codes[column]] for name, column in DERIVED.items()}
+    if eur_rate is None:
+        eur_rate = lookups["eur_rate"][codes["issue_currency"]]
+    if gbp_rate is None:
+        gbp_rate = lookups["gbp_rate"][codes["issue_currency"]]
+    issue_size = np.asarray(issue_size, dtype=float)
+    trade_size = np.asarray(trade_size, dtype=float)
+
+    # Only the sizes are broadcast to the full shape. Text columns keep their
+    # own and their segments broadcast against the sizes, so rates with extra
+    # leading dimensions (a row per shocked rate, see fx_stress.py) do not
+    # repeat the per-label work.
+    shape = np.broadcast_shapes(*(np.shape(a) for a in (issue_size, trade_size, eur_rate, gbp_rate)),
+                                *(np.shape(c) for c in codes.values()))
+    issue_size_eur = np.broadcast_to(issue_size * eur_rate, shape)
+    issue_size_gbp = np.broadcast_to(issue_size * gbp_rate, shape)
+    trade_size_eur = np.broadcast_to(trade_size * eur_rate, shape)
+    trade_size_gbp = np.broadcast_to(trade_size * gbp_rate, shape)
+
+    return {
+        "uk_sovereign": uk_sovereign(t, issue_size_gbp, trade_size_gbp,
+                                     derived["liquid_country"] & derived["conventional"], derived["tenor"]),
+        "uk_corporate": uk_corporate(t, issue_size_gbp, trade_size_gbp,
+                                     derived["liquid_currency"], derived["graded"]),
+        "eu_sovereign": eu(t, "eu_sovereign", issue_size_eur, trade_size_eur),
+        "eu_corporate": eu(t, "eu_corporate", issue_size_eur, trade_size_eur),
+        "eu_covered": eu(t, "eu_covered", issue_size_eur, trade_size_eur),
+    }
+
+
+_MESSAGE_ARRAYS = {
+    regime: np.array([deferral_rules.message(regime, key) for key in OUTCOMES], dtype=object)
+    for regime in REGIMES
+}
+
+
+def messages(regime, codes):
+    """Map an array of codes for one regime back to the callback strings."""
+    return _MESSAGE_ARRAYS[regime][codes]
+
+
+def classify_messages(*args, **kwargs):
+    """Same as classify() but returns the message strings for each regime."""
+    return {regime: messages(regime, codes)
+            for regime, codes in classify(*args, **kwargs).items()}
@@ -0,0 +1,445 @@
+"""
+UK and EU deferral thresholds as data.
+
+The thresholds live in deferral_rules.json: one breakpoint ladder per
+regime / asset class / liquidity segment. At load time every ladder is
+compiled into a sorted list of edges, so classifying a trade is one dict
+lookup for its segment plus a bisect over the trade size.
+
+A break is written as [">", x] (the next band starts above x) or [">=", x]
+(the next band starts at x). Both are compiled to strict "trade > edge"
+edges, a ">=" break using the next float below x, so bisect_left gives the
+band directly. A null outcome marks a band the published rules leave
+undefined.
+
+The file is either one rule set (an object of regime -> rules) or a history
+of rule sets with the date each came into force:
+
+    {"versions": [{"effective_from": null, "rules": {...}},
+                  {"effective_from": "2026-01-01", "rules": {...}}]}
+
+The first version must have a null effective_from and covers every earlier
+date. A trade is classified under the version in force on its trade date, and
+trades without a date use the version in force today (see RuleHistory).
+
+The rules file is re-read when it changes on disk (checked at most every
+RELOAD_INTERVAL seconds), so new thresholds are picked up by running gunicorn
+workers without a restart.
+
+This module and fx_rates are the core of the checker: they only use the
+standard library and import in a few milliseconds (json, hashlib and logging
+are imported when the rules are first read), so batch scripts and serverless
+handlers do not pay for the Dash app. benchmarks/import_budget.py keeps it so.
+"""
+
+import bisect
+import datetime
+import math
+import os
+import threading
+import time
+
+import deferral_cache
+import fx_rates
+from fx_rates import eur_xe, gbp_xe
+
+
+def _logger():
+    import logging
+    return logging.getLogger(__name__)
+
+RULES_FILE = os.environ.get(
+    "DEFERRAL_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "deferral_rules.json"))
+
+RELOAD_INTERVAL = 5.0
+
+REGIMES = ("uk_sovereign", "uk_corporate", "eu_sovereign", "eu_corporate", "eu_covered")
+
+# Segment parameters read by the segment functions here and in
+# deferral_engine, checked when a rules file is loaded
+THRESHOLDS = ("issue_size_threshold",)
+NAME_LISTS = {"uk_sovereign": ("liquid_countries",), "uk_corporate": ("liquid_currencies",)}
+
+# Outcome keys used in the rules file. The position in this tuple is the
+# integer code used by the vectorised engine; None (code 0) means no outcome.
+OUTCOMES = (None, "RT", "15M", "EOD", "1D", "EOD_1W", "EOD_2W", "2W", "4W", "3M",
+            "UNKNOWN", "INCOMPLETE")
+OUTCOME_CODES = {key: code for code, key in enumerate(OUTCOMES)}
+
+_UK = {
+    "RT": "Price and volume in real time",
+    "1D": "Price and volume deferred 1 day",
+    "2W": "Price and volume deferred 2 weeks",
+    "3M": "Price and volume deferred 3 months",
+    "INCOMPLETE": "Enter all fields or contact ICMA",
+}
+_EU = {
+    "RT": "Price and volume in real time",
+    "15M": "Price and volume deferred 15 minutes",
+    "EOD_1W": "EOD price deferral and 1 week volume deferral",
+    "EOD": "Price and volume deferred EOD",
+    "EOD_2W": "EOD price deferral and 2 week volume deferral",
+    "4W": "Price and volume deferred 4 weeks",
+}
+
+
+def _suffixed(messages, suffix):
+    return {key: message + suffix for key, message in messages.items()}
+
+
+# Messages shown for each outcome, exactly as the Dash callbacks display them
+MESSAGES = {
+    "uk_sovereign": dict(_UK),
+    "uk_corporate": dict(_UK),
+    "eu_sovereign": dict(_EU, UNKNOWN="Unknown condition"),
+    "eu_corporate": dict(_suffixed(_EU, " (corporate, convertible and other bonds)"),
+                         INCOMPLETE="Enter all fields or contact ICMA"),
+    "eu_covered": dict(_suffixed(_EU, " (covered bonds only)"),
+                       INCOMPLETE="Enter all fields or contact ICMA"),
+}
+
+
+def message(regime, outcome):
+    return MESSAGES[regime].get(outcome)
+
+
+class Ladder:
+    """Sorted trade-size edges for one segment and the outcome of each band."""
+
+    __slots__ = ("edges", "outcomes", "breaks")
+
+    def __init__(self, breaks, outcomes):
+        edges = []
+        for op, value in breaks:
+            if op == ">":
+                edges.append(float(value))
+            elif op == ">=":
+                edges.append(math.nextafter(float(value), -math.inf))
+            else:
+                raise ValueError(f"Unknown break operator {op!r}")
+        if edges != sorted(edges):
+            raise ValueError(f"Breaks must be in increasing order: {breaks}")
+        if len(outcomes) != len(edges) + 1:
+            raise ValueError(f"Expected {len(edges) + 1} outcomes for {len(edges)} breaks, got {len(outcomes)}")
+        for outcome in outcomes:
+            if outcome not in OUTCOME_CODES:
+                raise ValueError(f"Unknown outcome {outcome!r}")
+        self.breaks = [(op, float(value)) for op, value in breaks]
+        self.edges = edges
+        self.outcomes = tuple(outcomes)
+
+    def band(self, size):
+        return bisect.bisect_left(self.edges, size)
+
+    def __getitem__(self, size):
+        return self.outcomes[bisect.bisect_left(self.edges, size)]
+
+
+def _check_parameters(regime, spec):
+    # A missing or mistyped parameter would otherwise only fail when a trade
+    # is classified, after a reload had already replaced the working rules
+    for key in THRESHOLDS:
+        value = spec.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+            raise ValueError(f"{regime}: {key} must be a number, got {value!r}")
+    for key in NAME_LISTS.get(regime, ()):
+        value = spec.get(key)
+        if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+            raise ValueError(f"{regime}: {key} must be a list of strings, got {value!r}")
+
+
+class RuleSet:
+    """Compiled rules: {(regime, segment): Ladder} plus the segment parameters."""
+
+    def __init__(self, spec, version=None):
+        self.spec = spec
+        if version is None:
+            import hashlib
+            import json
+            version = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+        self.version = version
+        self.ladders = {}
+        for regime in REGIMES:
+            if not isinstance(spec.get(regime), dict):
+                raise ValueError(f"Missing rules for {regime}")
+            _check_parameters(regime, spec[regime])
+            fallback = spec[regime].get("fallback")
+            if fallback not in OUTCOME_CODES:
+                raise ValueError(f"Unknown outcome {fallback!r}")
+            segments = spec[regime].get("segments")
+            if not isinstance(segments, dict):
+                raise ValueError(f"{regime}: segments must be an object of segment -> ladder")
+            for segment, ladder in segments.items():
+                if not isinstance(ladder, dict) or "breaks" not in ladder or "outcomes" not in ladder:
+                    raise ValueError(f"{regime}: segment {segment!r} needs breaks and outcomes")
+                self.ladders[regime, segment] = Ladder(ladder["breaks"], ladder["outcomes"])
+
+    def __getitem__(self, regime):
+        return self.spec[regime]
+
+    def segments(self, regime):
+        return list(self.spec[regime]["segments"])
+
+    def lookup(self, regime, segment, size):
+        """Outcome for a trade of the given size (in the regime currency)."""
+        ladder = self.ladders.get((regime, segment))
+        if ladder is None:
+            return None
+        if ladder.edges and math.isnan(size):
+            return self.spec[regime].get("fallback")
+        return ladder[size]
+
+    def bands(self, regime, segment, rate):
+        """Trade-size bands of a segment, converted from the regime currency
+        with rate (regime currency per unit of trade currency).
+
+        Each band is {"from": lower bound or None, "inclusive": whether the
+        bound itself is in the band, "outcome": key}; neighbouring bands with
+        the same outcome are merged. Empty for segments the rules do not define.
+        """
+        ladder = self.ladders.get((regime, segment))
+        if ladder is None:
+            return []
+        bands = [{"from": None, "inclusive": False, "outcome": ladder.outcomes[0]}]
+        for (op, value), outcome in zip(ladder.breaks, ladder.outcomes[1:]):
+            if outcome != bands[-1]["outcome"]:
+                bands.append({"from": value / rate, "inclusive": op == ">=", "outcome": outcome})
+        return bands
+
+
+_ladder_cache = deferral_cache.cache("ladders", maxsize=1024)
+
+
+class RuleHistory:
+    """Rule sets in order of their effective_from date (ISO strings).
+
+    starts[0] is None and rule_sets[0] applies before any later version.
+    """
+
+    def __init__(self, versions, version=None):
+        self.starts = []
+        self.rule_sets = []
+        for i, (effective_from, rules) in enumerate(versions):
+            start = iso_date(effective_from)
+            if (start is None) != (i == 0):
+                raise ValueError("Only the first rules version has a null effective_from")
+            if i > 1 and start <= self.starts[-1]:
+                raise ValueError(f"Rules versions must be in increasing effective_from order, got {start}")
+            self.starts.append(start)
+            self.rule_sets.append(rules)
+        if not self.rule_sets:
+            raise ValueError("No rules versions")
+        self.version = version or "+".join(rules.version for rules in self.rule_sets)
+
+    def __len__(self):
+        return len(self.rule_sets)
+
+    def index(self, trade_date=None):
+        """Position in rule_sets of the version in force on trade_date (default today)."""
+        # Parsed first, so a malformed date is an error with one version too
+        date = iso_date(trade_date)
+        if len(self.rule_sets) == 1:
+            return 0
+        return bisect.bisect_right(self.starts, date or time.strftime("%Y-%m-%d"), 1) - 1
+
+    def at(self, trade_date=None):
+        """The RuleSet in force on trade_date (a date or ISO string, default today)."""
+        return self.rule_sets[self.index(trade_date)]
+
+
+def iso_date(value):
+    """The "YYYY-MM-DD" form of a date, datetime, numpy datetime64 or ISO string; None if empty.
+
+    Raises ValueError for anything else, including impossible dates.
+    """
+    if value is None:
+        return None
+    text = str(value).strip()[:10]
+    if not text or text == "NaT":
+        return None
+    if len(text) != 10 or text[4] != "-" or text[7] != "-" or not (text[:4] + text[5:7] + text[8:]).isdigit():
+        raise ValueError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+    try:
+        datetime.date.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid date {value!r}, not a calendar date")
+    return text
+
+
+def load_history(path=RULES_FILE):
+    import hashlib
+    import json
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    spec = json.loads(raw)
+    version = hashlib.sha1(raw).hexdigest()[:12]
+    if "versions" not in spec:
+        return RuleHistory([(None, RuleSet(spec, version=version))], version=version)
+    return RuleHistory([(v.get("effective_from"), RuleSet(v["rules"])) for v in spec["versions"]],
+                       version=version)
+
+
+def load(path=RULES_FILE):
+    """The rule set in force today from the file at path."""
+    return load_history(path).at()
+
+
+_lock = threading.Lock()
+_history = None
+_mtime = None
+_checked = 0.0
+_fx_fingerprint = None
+
+
+def history():
+    """The compiled rule history, reloaded if the rules file has changed on disk."""
+    global _history, _mtime, _checked, _fx_fingerprint
+    now = time.monotonic()
+    if _history is not None and now - _checked < RELOAD_INTERVAL:
+        return _history
+    with _lock:
+        _checked = now
+        try:
+            mtime = os.stat(RULES_FILE).st_mtime_ns
+        except OSError:
+            mtime = None
+        if _history is None or (mtime is not None and mtime != _mtime):
+            try:
+                rules = load_history(RULES_FILE)
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                if _history is None:
+                    raise
+                _logger().error("Keeping rules %s, could not reload %s: %s", _history.version, RULES_FILE, exc)
+            else:
+                if _history is not None:
+                    _logger().info("Reloaded deferral rules %s from %s", rules.version, RULES_FILE)
+                    deferral_cache.invalidate()
+                _history = rules
+            _mtime = mtime
+        fingerprint = fx_rates.fingerprint()
+        if fingerprint != _fx_fingerprint:
+            if _fx_fingerprint is not None:
+                _logger().info("FX rates changed, clearing deferral caches")
+                deferral_cache.invalidate()
+            _fx_fingerprint = fingerprint
+    return _history
+
+
+def current():
+    """The rules in force today, reloaded if the rules file has changed on disk."""
+    return history().at()
+
+
+def rules_at(trade_date=None):
+    """The rules in force on trade_date (a date or "YYYY-MM-DD", default today)."""
+    return history().at(trade_date)
+
+
+def reload():
+    """Re-read the rules file now, whatever its modification time."""
+    global _checked, _mtime
+    with _lock:
+        _checked = 0.0
+        _mtime = None
+    return current()
+
+
+# Segment selection, mirroring the structure of the published rules
+
+def uk_sovereign_segment(rules, issue_size_gbp, maturity, issuer_country, strip_inflation):
+    spec = rules["uk_sovereign"]
+    if math.isnan(issue_size_gbp):
+        return "unknown issue size"
+    if issue_size_gbp >= spec["issue_size_threshold"]:
+        if issuer_country in spec["liquid_countries"] and strip_inflation == 'No':
+            return f"liquid {maturity}"
+        return "other"
+    return "small"
+
+
+def uk_corporate_segment(rules, issue_size_gbp, issue_currency, rating):
+    spec = rules["uk_corporate"]
+    if math.isnan(issue_size_gbp):
+        return "unknown issue size"
+    if issue_size_gbp >= spec["issue_size_threshold"] and issue_currency in spec["liquid_currencies"]:
+        return f"rating {rating}"
+    return "other"
+
+
+def eu_segment(rules, regime, issue_size_eur):
+    if math.isnan(issue_size_eur):
+        return "unknown issue size"
+    if issue_size_eur >= rules[regime]["issue_size_threshold"]:
+        return "large"
+    return "small"
+
+
+# Scalar classification, returning outcome keys (see MESSAGES)
+
+def uk_sovereign(issue_size_gbp, trade_size_gbp, maturity, issuer_country, strip_inflation, rules=None):
+    rules = rules or current()
+    segment = uk_sovereign_segment(rules, issue_size_gbp, maturity, issuer_country, strip_inflation)
+    return rules.lookup("uk_sovereign", segment, trade_size_gbp)
+
+
+def uk_corporate(issue_size_gbp, trade_size_gbp, issue_currency, rating, rules=None):
+    rules = rules or current()
+    segment = uk_corporate_segment(rules, issue_size_gbp, issue_currency, rating)
+    return rules.lookup("uk_corporate", segment, trade_size_gbp)
+
+
+def eu(regime, issue_size_eur, trade_size_eur, rules=None):
+    rules = rules or current()
+    segment = eu_segment(rules, regime, issue_size_eur)
+    return rules.lookup(regime, segment, trade_size_eur)
+
+
+def classify_trade(issue_currency, issue_size, trade_size, maturity=None, issuer_country=None,
+                   strip_inflation=None, rating=None, rules=None, trade_date=None):
+    """Outcome key of one trade under every regime, sizes in the issue currency.
+
+    Sizes are converted with the fx_rates snapshot, exactly as the callbacks do.
+    The rules are those in force on trade_date (default today).
+    """
+    rules = rules or rules_at(trade_date)
+    eur = eur_xe.get(issue_currency, 1)
+    gbp = gbp_xe.get(issue_currency, 1)
+    return {
+        "uk_sovereign": uk_sovereign(issue_size * gbp, trade_size * gbp, maturity,
+                                     issuer_country, strip_inflation, rules),
+        "uk_corporate": uk_corporate(issue_size * gbp, trade_size * gbp, issue_currency, rating, rules),
+        "eu_sovereign": eu("eu_sovereign", issue_size * eur, trade_size * eur, rules),
+        "eu_corporate": eu("eu_corporate", issue_size * eur, trade_size * eur, rules),
+        "eu_covered": eu("eu_covered", issue_size * eur, trade_size * eur, rules),
+    }
+
+
+def issue_ladders(issue_currency, issue_size, maturity=None, issuer_country=None,
+                  strip_inflation=None, rating=None, rules=None, trade_date=None):
+    """Trade-size breakpoints of one issue under every regime.
+
+    Returns {regime: {"segment": name, "bands": [...]}} with the bands of
+    RuleSet.bands() in the issue currency, converted with the fx_rates
+    snapshot like classify_trade(). Issues that fall in the same segments
+    share one cached table. The rules are those in force on trade_date
+    (default today).
+    """
+    rules = rules or rules_at(trade_date)
+    eur = eur_xe.get(issue_currency, 1)
+    gbp = gbp_xe.get(issue_currency, 1)
+    segments = (
+        ("uk_sovereign", gbp, uk_sovereign_segment(rules, issue_size * gbp, maturity,
+                                                   issuer_country, strip_inflation)),
+        ("uk_corporate", gbp, uk_corporate_segment(rules, issue_size * gbp, issue_currency, rating)),
+        ("eu_sovereign", eur, eu_segment(rules, "eu_sovereign", issue_size * eur)),
+        ("eu_corporate", eur, eu_segment(rules, "eu_corporate", issue_size * eur)),
+        ("eu_covered", eur, eu_segment(rules, "eu_covered", issue_size * eur)),
+    )
+
+    def build(key):
+        return {regime: {"segment": segment if (regime, segment) in rules.ladders else None,
+                         "bands": rules.bands(regime, segment, rate)}
+                for regime, rate, segment in segments}
+
+    return _ladder_cache.get((rules.version, eur, gbp) + tuple(s for _, _, s in segments), build)
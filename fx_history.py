@@ -0,0 +1,159 @@
+"""
+Date-indexed FX rates for historical (as-of) conversion.
+
+The source is a CSV file with one row per observation:
+
+    date,currency,eur
+    2024-11-05,USD,0.9182
+    2024-11-05,GBP,1.1973
+
+where eur is the value of one unit of the currency in EUR. EUR is the single
+base: GBP conversions are cross rates derived from the same observations, so
+EUR and GBP figures can never disagree with each other.
+
+On first use the CSV is compiled into a dense, forward-filled matrix of
+rates[date, currency] saved as .npy files next to it. Those are opened with
+mmap_mode="r", so every gunicorn worker shares one copy through the page
+cache. Lookups are vectorised: a whole column of (currency, trade date) pairs
+is converted with one searchsorted and one fancy index. Unknown currencies and
+dates before a currency's first observation give NaN, never a default of 1.
+"""
+
+import csv
+import json
+import os
+
+import numpy as np
+
+import deferral_cache
+
+FX_HISTORY_FILE = os.environ.get("FX_HISTORY_FILE")
+
+
+def _cache_dir(path):
+    return path + ".cache"
+
+
+def build(path):
+    """Compile the CSV at path into the .npy cache and return its directory."""
+    observations = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            observations[row["date"].strip(), row["currency"].strip().upper()] = float(row["eur"])
+
+    dates = np.unique(np.array([d for d, _ in observations], dtype="datetime64[D]"))
+    currencies = sorted({c for _, c in observations} | {"EUR"})
+    column = {c: i for i, c in enumerate(currencies)}
+
+    rates = np.full((len(dates), len(currencies)), np.nan)
+    if observations:
+        rows = np.searchsorted(dates, np.array([d for d, _ in observations], dtype="datetime64[D]"))
+        cols = np.array([column[c] for _, c in observations])
+        rates[rows, cols] = list(observations.values())
+    rates[:, column["EUR"]] = 1.0
+
+    # Forward fill each currency so a date without a quote uses the last one
+    filled = np.where(np.isnan(rates), 0, np.arange(len(dates))[:, None])
+    np.maximum.accumulate(filled, axis=0, out=filled)
+    rates = rates[filled, np.arange(len(currencies))]
+
+    cache = _cache_dir(path)
+    tmp = cache + f".tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, "dates.npy"), dates.astype(np.int64))
+    np.save(os.path.join(tmp, "rates.npy"), rates)
+    stat = os.stat(path)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"currencies": currencies, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}, f)
+    # Swap the new cache in; another worker may have built one concurrently
+    if os.path.isdir(cache):
+        old = cache + f".old{os.getpid()}"
+        os.replace(cache, old)
+        os.replace(tmp, cache)
+        for name in os.listdir(old):
+            os.remove(os.path.join(old, name))
+        os.rmdir(old)
+    else:
+        os.replace(tmp, cache)
+    return cache
+
+
+def _cache_is_fresh(path):
+    try:
+        with open(os.path.join(_cache_dir(path), "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    stat = os.stat(path)
+    return meta.get("mtime_ns") == stat.st_mtime_ns and meta.get("size") == stat.st_size
+
+
+class FxHistory:
+    """Memory-mapped EUR-based rate history with vectorised as-of lookups."""
+
+    def __init__(self, path):
+        self.path = path
+        if not _cache_is_fresh(path):
+            build(path)
+        cache = _cache_dir(path)
+        with open(os.path.join(cache, "meta.json")) as f:
+            self.currencies = json.load(f)["currencies"]
+        self.column = {c: i for i, c in enumerate(self.currencies)}
+        self.dates = np.load(os.path.join(cache, "dates.npy"), mmap_mode="r").view("datetime64[D]")
+        self.rates = np.load(os.path.join(cache, "rates.npy"), mmap_mode="r")
+
+    def _columns(self, currency):
+        currency = np.asarray(currency, dtype=object).astype(str)
+        uniq, inverse = np.unique(currency, return_inverse=True)
+        cols = np.array([self.column.get(c.upper(), -1) for c in uniq], dtype=np.intp)
+        return cols[inverse.reshape(currency.shape)]
+
+    def _rows(self, dates):
+        # Row of the last observation on or before each date: -1 before the
+        # first observation, -2 for a missing date
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        rows = np.searchsorted(self.dates, dates, side="right") - 1
+        return np.where(np.isnat(dates), -2, rows)
+
+    def _lookup(self, rows, cols):
+        valid = (rows >= 0) & (cols >= 0)
+        out = np.asarray(self.rates[np.where(valid, rows, 0), np.where(valid, cols, 0)], dtype=float)
+        out[~valid] = np.nan
+        # EUR is the base, so it is known on any date
+        out[(cols == self.column["EUR"]) & (rows >= -1)] = 1.0
+        return out
+
+    def eur_rate(self, currency, dates):
+        """EUR value of one unit of each currency on (or before) each date."""
+        rows, cols = np.broadcast_arrays(self._rows(dates), self._columns(currency))
+        return self._lookup(rows, cols)
+
+    def cross_rates(self, currency, dates):
+        """(eur_rate, gbp_rate) arrays for each (currency, date) pair.
+
+        Both come from the same EUR-based observation, GBP being the cross
+        rate eur_rate(currency) / eur_rate(GBP) on that date.
+        """
+        rows, cols = np.broadcast_arrays(self._rows(dates), self._columns(currency))
+        eur = self._lookup(rows, cols)
+        gbp_col = self.column.get("GBP", -1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            gbp = eur / self._lookup(rows, np.full(rows.shape, gbp_col))
+        return eur, gbp
+
+
+_history = {}
+
+
+def load(path=None):
+    """Shared FxHistory for path (default: $FX_HISTORY_FILE), or None if unset."""
+    path = path or FX_HISTORY_FILE
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    history = _history.get(path)
+    if history is None or not _cache_is_fresh(path):
+        if history is not None:
+            deferral_cache.invalidate()
+        history = _history[path] = FxHistory(path)
+    return history
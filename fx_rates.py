@@ -0,0 +1,47 @@
+"""
+EUR and GBP conversion rates used by the deferral checker.
+
+Each table gives the value of one unit of the issue currency in EUR or GBP.
+"""
+
+# Define exchange rates for EUR and GBP
+eur_xe = {
+    "EUR": 1,    
+    "USD": 0.9,   
+    "GBP": 1.186,    
+    "PLN": 0.2337,     
+    "HUF": 0.0025,     
+    "CZK": 0.04,      
+    "RON": 0.2,      
+    "NOK": 0.085,      
+    "DKK": 0.13,     
+    "SEK": 0.088,    
+    "ISK": 0.0065,        
+    "BGN": 0.51,     
+    "CHF": 1.07,       
+    "CAD": 0.67,     
+    "JPY": 0.0063
+}
+
+gbp_xe = {
+    "EUR": 0.8422,    
+    "USD": 0.7581,   
+    "GBP": 1,    
+    "PLN": 0.2,     
+    "HUF": 0.0021 ,     
+    "CZK": 0.034,      
+    "RON": 0.1693,      
+    "NOK": 0.071,      
+    "DKK": 0.1128,     
+    "SEK": 0.074,    
+    "ISK": 0.0055,        
+    "BGN": 0.4304,     
+    "CHF": 0.8975,       
+    "CAD": 0.5612,     
+    "JPY": 0.005293
+}
+
+
+def fingerprint():
+    """Changes whenever either rate table is modified."""
+    return hash((tuple(sorted(eur_xe.items())), tuple(sorted(gbp_xe.items()))))
@@ -0,0 +1,295 @@
+"""
+FX shock stress test: which trades change deferral outcome when rates move.
+
+    python fx_stress.py book.csv --random 1000 --volatility 5 -o flips.csv
+    python fx_stress.py book.csv --scenarios shocks.csv
+
+A scenario moves each currency against EUR by a percentage:
+
+    scenario,USD,GBP,JPY
+    usd_down,-10,0,0
+    gbp_up,0,5,0
+
+so the EUR value of a USD trade is eur_xe["USD"] * 0.9 in usd_down, and GBP
+figures use the shocked cross rate (the currency's move over GBP's move).
+Currencies a scenario leaves out do not move. --random draws independent
+normal moves with --volatility percent standard deviation instead.
+
+The book is read in chunks and each chunk is classified once at the base
+rates. Every segment choice is an issue size threshold and every band a trade
+size edge, both crossed monotonically as a rate moves, so a trade's outcome
+under a regime only depends on which interval between its crossings (the
+multipliers of its EUR or GBP rate at which a converted size meets a
+threshold or edge) the rate falls in. For each trade, the crossings between
+its lowest and highest shocked rate are found first; trades with none are
+skipped. Then, for all scenarios at once, an (S, N) array of scenario
+multipliers is compared with the (N, K) crossings, K being a handful, with no
+loop over scenarios. deferral_engine.classify() is run on one multiplier per
+interval, (K + 1, N) cells, and looked up for every cell that left the
+interval of the base rate. Cells within TOLERANCE of a crossing, where
+rounding could decide the side, are classified at their own rates. Trades
+are handled in blocks of at most MAX_CELLS trade x scenario cells.
+
+Changed outcomes are written with -o as CSV rows (trade, scenario, regime,
+base, stressed), trade being the 0-based row of the book, and summarised on
+stdout. Trades are classified under the rules in force today.
+"""
+
+import argparse
+import csv
+import sys
+import time
+
+import numpy as np
+
+import blotter
+import deferral_engine
+import deferral_rules
+import fx_history
+import instruments
+from deferral_rules import OUTCOMES, REGIMES
+from fx_rates import eur_xe, gbp_xe
+
+MAX_CELLS = 4000000
+
+# Relative distance from a crossing within which a cell is classified at its
+# own rates rather than looked up, as rounding could put it on either side
+TOLERANCE = 1e-9
+
+# Regimes sized in GBP, the others are sized in EUR
+GBP_REGIMES = ("uk_sovereign", "uk_corporate")
+EUR_REGIMES = tuple(r for r in REGIMES if r not in GBP_REGIMES)
+
+
+class Scenarios:
+    """S named scenarios of relative moves (0.05 = 5% stronger) for C currencies against EUR."""
+
+    def __init__(self, names, currencies, moves):
+        self.names = list(names)
+        self.currencies = [c.upper() for c in currencies]
+        self.moves = np.asarray(moves, dtype=float).reshape(len(self.names), len(self.currencies))
+        if "EUR" in self.currencies and self.moves[:, self.currencies.index("EUR")].any():
+            raise ValueError("EUR is the base currency and cannot move")
+        if (self.moves <= -1).any():
+            raise ValueError("A currency cannot lose 100% or more of its value")
+
+    def __len__(self):
+        return len(self.names)
+
+    def multipliers(self):
+        """(S, C + 1) EUR and GBP rate multipliers per scenario and currency.
+
+        The last column is for currencies no scenario moves.
+        """
+        eur = np.concatenate([1 + self.moves, np.ones((len(self), 1))], axis=1)
+        gbp = eur / (eur[:, [self.currencies.index("GBP")]] if "GBP" in self.currencies else 1.0)
+        return eur, gbp
+
+
+def read_scenarios(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [row for row in reader if row]
+    try:
+        moves = [[float(v or 0) / 100 for v in row[1:]] for row in rows]
+    except ValueError as exc:
+        raise ValueError(f"{path}: moves must be percentages ({exc})")
+    return Scenarios([row[0] for row in rows], header[1:], moves)
+
+
+def random_scenarios(count, volatility, seed=0, currencies=None):
+    currencies = currencies or [c for c in eur_xe if c != "EUR"]
+    moves = np.random.default_rng(seed).normal(0, volatility / 100, (count, len(currencies)))
+    return Scenarios([f"random_{i}" for i in range(count)], currencies, np.maximum(moves, -0.99))
+
+
+def _crossings(tables, rules, regimes, issue_size, trade_size, low, high):
+    # Sorted rate multipliers at which each trade's converted sizes cross an
+    # issue size threshold or a ladder edge of `regimes`, (N, K) padded with
+    # inf. Only those between the trade's lowest and highest multiplier count.
+    edges = np.unique(np.concatenate([tables.edges[r][np.isfinite(tables.edges[r])] for r in regimes]))
+    thresholds = np.unique([float(rules[r]["issue_size_threshold"]) for r in regimes])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        points = np.concatenate([thresholds / issue_size[:, None], edges / trade_size[:, None]], axis=1)
+        inside = (points >= low[:, None] * (1 - TOLERANCE)) & (points <= high[:, None] * (1 + TOLERANCE))
+    points[~inside] = np.inf
+    points.sort(axis=1)
+    return points[:, :inside.sum(axis=1).max(initial=0)]
+
+
+def _intervals(multiplier, points):
+    # Interval of each multiplier between its trade's crossings, and whether
+    # it is within TOLERANCE of a crossing, where rounding could decide
+    interval = np.zeros(np.shape(multiplier), dtype=np.int8)
+    unsure = np.zeros(np.shape(multiplier), dtype=np.int8)
+    for column in points.T:
+        interval += multiplier > column * (1 + TOLERANCE)
+        unsure += multiplier > column * (1 - TOLERANCE)
+    return interval, unsure != interval
+
+
+def _representatives(points, low, high):
+    # A multiplier well inside each interval of each trade, within the
+    # trade's range so that no crossing left out of points is passed: (K + 1, N)
+    lower = np.concatenate([low[:, None], points], axis=1)
+    upper = np.concatenate([points, high[:, None]], axis=1)
+    return ((np.minimum(lower, high[:, None]) + np.minimum(upper, high[:, None])) / 2).T
+
+
+def stress(columns, scenarios, rules=None, max_cells=MAX_CELLS):
+    """Classify trades at base rates and under every scenario.
+
+    columns are deferral_engine.classify() arguments for N trades (as from
+    blotter.parse_chunk()); eur_rate/gbp_rate, if given, are the base rates.
+    Returns (base, flips, near): base is {regime: codes}, flips is
+    {regime: (trade, scenario, code)} arrays of the cells whose outcome
+    differs from base, near the number of trades that had to be reclassified.
+    """
+    rules = rules or deferral_rules.current()
+    tables = deferral_engine.tables(rules)
+    columns = {name: values for name, values in columns.items() if name != "trade_date"}
+    currency = deferral_engine.labels(columns["issue_currency"])
+    n = len(columns["trade_size"])
+    currency = np.broadcast_to(currency, (n,))
+    issue_size = np.broadcast_to(np.asarray(columns["issue_size"], dtype=float), (n,))
+    trade_size = np.asarray(columns["trade_size"], dtype=float)
+
+    eur_rate, gbp_rate = columns.get("eur_rate"), columns.get("gbp_rate")
+    if eur_rate is None or gbp_rate is None:
+        default_eur, default_gbp = deferral_engine.default_rates(currency, eur_xe, gbp_xe)
+        eur_rate = default_eur if eur_rate is None else eur_rate
+        gbp_rate = default_gbp if gbp_rate is None else gbp_rate
+    eur_rate = np.broadcast_to(np.asarray(eur_rate, dtype=float), (n,))
+    gbp_rate = np.broadcast_to(np.asarray(gbp_rate, dtype=float), (n,))
+    base = deferral_engine.classify(**dict(columns, eur_rate=eur_rate, gbp_rate=gbp_rate), rules=rules)
+
+    # Scenario column of each trade's currency, the extra last one if unshocked
+    index = {c: i for i, c in enumerate(scenarios.currencies)}
+    uniq, inverse = np.unique(currency, return_inverse=True)
+    column = np.array([index.get(c.upper(), len(index)) for c in uniq], dtype=np.intp)[inverse]
+    eur_mult, gbp_mult = scenarios.multipliers()
+
+    # Per rate: its regimes, base rates, (S, C + 1) multipliers and each
+    # trade's crossings between its lowest and highest multiplier, base included
+    rates = []
+    for name, regimes, rate, mult in (("eur_rate", EUR_REGIMES, eur_rate, eur_mult),
+                                      ("gbp_rate", GBP_REGIMES, gbp_rate, gbp_mult)):
+        low = np.minimum(mult.min(axis=0), 1)[column]
+        high = np.maximum(mult.max(axis=0), 1)[column]
+        points = _crossings(tables, rules, regimes, issue_size * rate, trade_size * rate, low, high)
+        rates.append((name, regimes, rate, mult, low, high, points))
+    near = np.flatnonzero(np.logical_or.reduce([np.isfinite(r[-1]).any(axis=1) for r in rates]))
+
+    found = {regime: ([], [], []) for regime in REGIMES}
+
+    def record(regimes, codes, rows, scenario, trade):
+        for regime in regimes:
+            changed = codes[regime] != base[regime][rows[trade]]
+            found[regime][0].append(rows[trade[changed]])
+            found[regime][1].append(scenario[changed])
+            found[regime][2].append(codes[regime][changed])
+
+    block = max(max_cells // max(len(scenarios), 1), 1)
+    for start in range(0, len(near), block):
+        rows = near[start:start + block]
+        cells = {name: values if values is None or np.ndim(values) == 0 else np.asarray(values)[rows]
+                 for name, values in columns.items()}
+        cells.update(eur_rate=eur_rate[rows], gbp_rate=gbp_rate[rows])
+        for name, regimes, rate, mult, low, high, points in rates:
+            low, high, points = low[rows], high[rows], points[rows]
+            # (S, rows): the interval every scenario puts every trade in, at once
+            interval, unsure = _intervals(mult[:, column[rows]], points)
+            at_base, base_unsure = _intervals(np.ones(len(rows)), points)
+            unsure |= base_unsure
+
+            # Outcomes are constant within an interval: classify one multiplier
+            # per interval, (K + 1, rows), and look up the cells that left the
+            # base rate's interval
+            codes = deferral_engine.classify(**dict(cells, **{name: rate[rows] * _representatives(points, low, high)}),
+                                             rules=rules)
+            scenario, trade = np.nonzero((interval != at_base) & ~unsure)
+            record(regimes, {r: codes[r][interval[scenario, trade], trade] for r in regimes},
+                   rows, scenario, trade)
+
+            # Cells too close to a crossing are classified at their own rates
+            scenario, trade = np.nonzero(unsure)
+            if len(scenario):
+                exact = {name: values if values is None or np.ndim(values) == 0 else values[trade]
+                         for name, values in cells.items()}
+                exact["eur_rate"] = exact["eur_rate"] * eur_mult[scenario, column[rows[trade]]]
+                exact["gbp_rate"] = exact["gbp_rate"] * gbp_mult[scenario, column[rows[trade]]]
+                record(regimes, deferral_engine.classify(**exact, rules=rules), rows, scenario, trade)
+
+    flips = {regime: tuple(np.concatenate(parts) if parts else np.array([], dtype=np.intp) for parts in found[regime])
+             for regime in REGIMES}
+    return base, flips, len(near)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reclassify a book of trades under FX shock scenarios.")
+    parser.add_argument("input", help="CSV or Excel book of trades")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--scenarios", help="CSV of scenario name and percentage move per currency against EUR")
+    source.add_argument("--random", type=int, metavar="N", help="N random scenarios")
+    parser.add_argument("--volatility", type=float, default=5.0,
+                        help="standard deviation of the random moves, in percent (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="CSV of every changed outcome (trade, scenario, regime, base, stressed)")
+    parser.add_argument("--chunk-size", type=int, default=100000,
+                        help="trades of the book read per pass (default: %(default)s)")
+    parser.add_argument("--fx-history", default=fx_history.FX_HISTORY_FILE,
+                        help="CSV of dated EUR rates; trades with a trade_date are shocked from the rates "
+                             "on that date (default: $FX_HISTORY_FILE)")
+    parser.add_argument("--instruments", default=instruments.INSTRUMENTS_FILE,
+                        help="CSV of instrument reference data by ISIN (default: $INSTRUMENTS_FILE)")
+    args = parser.parse_args(argv)
+
+    scenarios = (read_scenarios(args.scenarios) if args.scenarios
+                 else random_scenarios(args.random, args.volatility, args.seed))
+    fx = fx_history.load(args.fx_history) if args.fx_history else None
+    store = instruments.load(args.instruments) if args.instruments else None
+    keys = np.array(OUTCOMES, dtype=object)
+
+    out = writer = None
+    if args.output:
+        out = open(args.output, "w", newline="", encoding="utf-8")
+        writer = csv.writer(out)
+        writer.writerow(["trade", "scenario", "regime", "base", "stressed"])
+
+    start = time.perf_counter()
+    offset = near = 0
+    flipped = {regime: set() for regime in REGIMES}
+    per_scenario = np.zeros(len(scenarios), dtype=np.int64)
+    try:
+        header, rows, _ = blotter.read_rows(args.input, blotter.file_format(args.input))
+        for chunk in blotter.chunks(rows, args.chunk_size):
+            base, flips, chunk_near = stress(blotter.parse_chunk(header, chunk, fx, store), scenarios)
+            near += chunk_near
+            for regime, (trade, scenario, code) in flips.items():
+                flipped[regime].update((trade + offset).tolist())
+                per_scenario += np.bincount(scenario, minlength=len(scenarios))
+                if writer is not None:
+                    order = np.lexsort((scenario, trade))
+                    writer.writerows(zip((trade[order] + offset).tolist(),
+                                         np.array(scenarios.names, dtype=object)[scenario[order]],
+                                         [regime] * len(order),
+                                         keys[base[regime][trade[order]]], keys[code[order]]))
+            offset += len(chunk)
+    finally:
+        if out is not None:
+            out.close()
+    seconds = time.perf_counter() - start
+
+    print(f"{offset:,} trades x {len(scenarios):,} scenarios in {seconds:.1f}s, "
+          f"{near:,} trades near a boundary")
+    for regime in REGIMES:
+        print(f"  {regime:<14} {len(flipped[regime]):>9,} trades change outcome in at least one scenario")
+    for i in np.argsort(per_scenario)[::-1][:5]:
+        if per_scenario[i]:
+            print(f"  {scenarios.names[i]}: {per_scenario[i]:,} changed outcomes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
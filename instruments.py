@@ -0,0 +1,218 @@
+"""
+Instrument reference data keyed by ISIN.
+
+The source is a CSV file with one row per instrument:
+
+    isin,issue_currency,issue_size,maturity,issuer_country,strip_inflation,rating
+    GB00BMGR2809,GBP,35000000000,<5,UK,No,
+    XS1234567890,EUR,500000000,,,,IG
+
+With a store loaded, trades only need an ISIN, a trade size and (optionally)
+a trade date: the batch paths join the trade list against the store in one
+vectorised step (searchsorted over the sorted ISINs) and fill in any issue
+attribute the trade itself leaves empty. Single lookups go through a dict.
+
+The file is treated as append-only: when it grows, only the new lines are
+parsed and upserted (a later row for an ISIN replaces the earlier one), so
+reference updates can be appended without a full rebuild. If the file is
+replaced or shrinks it is read again from scratch.
+"""
+
+import csv
+import io
+import math
+import os
+import threading
+
+import numpy as np
+
+import blotter
+
+INSTRUMENTS_FILE = os.environ.get("INSTRUMENTS_FILE")
+
+ISIN = blotter.ISIN
+ATTRIBUTES = tuple(c for c in blotter.COLUMNS if c != "trade_size")
+
+
+def normalise_isin(value):
+    return str(value or "").strip().upper()
+
+
+class _State:
+    # One consistent version of the indexes, swapped in whole on reload
+    __slots__ = ("index", "isins", "columns", "sorted", "order")
+
+    def __init__(self, index, isins, columns, sorted_isins, order):
+        self.index = index
+        self.isins = isins
+        self.columns = columns
+        self.sorted = sorted_isins
+        self.order = order
+
+
+def _empty_state():
+    return _State({}, np.array([], dtype=object),
+                  {name: np.array([], dtype=float if name in blotter.NUMERIC_COLUMNS else object)
+                   for name in ATTRIBUTES},
+                  np.array([], dtype=str), np.array([], dtype=np.intp))
+
+
+class InstrumentStore:
+    """ISIN -> issue attributes, with dict and sorted-array indexes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._rebuild()
+
+    def _rebuild(self):
+        self.header = None
+        self.offset = 0
+        self.inode = None
+        self._state = _empty_state()
+        self._read_new()
+
+    def __len__(self):
+        return len(self._state.index)
+
+    def _read_new(self):
+        # Parse complete lines added since the last read and upsert them
+        with open(self.path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return 0
+        lines = data[:end].decode("utf-8-sig" if self.offset == 0 else "utf-8")
+        self.offset += end
+
+        reader = csv.reader(io.StringIO(lines))
+        if self.header is None:
+            self.header = [blotter.normalise_header(h) for h in next(reader, [])]
+            if ISIN not in self.header:
+                raise ValueError(f"{self.path} has no {ISIN} column")
+        positions = {name: i for i, name in enumerate(self.header)}
+        rows = [row for row in reader if row]
+        if not rows:
+            return 0
+
+        # Last line of each ISIN in this batch, in first-seen order
+        latest = {}
+        for i, row in enumerate(rows):
+            isin = normalise_isin(row[positions[ISIN]] if positions[ISIN] < len(row) else None)
+            if isin:
+                latest[isin] = i
+        rows = [rows[i] for i in latest.values()]
+        parsed = {name: blotter.column(positions, rows, name,
+                                       blotter.number if name in blotter.NUMERIC_COLUMNS else blotter.label)
+                  for name in ATTRIBUTES}
+
+        old = self._state
+        index = dict(old.index)
+        added = [isin for isin in latest if isin not in index]
+        for k, isin in enumerate(added):
+            index[isin] = len(old.isins) + k
+        targets = np.array([index[isin] for isin in latest], dtype=np.intp)
+
+        columns = {}
+        for name, values in old.columns.items():
+            values = np.concatenate([values, np.empty(len(added), dtype=values.dtype)])
+            values[targets] = parsed[name]
+            columns[name] = values
+
+        sorted_isins, order = old.sorted, old.order
+        if added:
+            # Merge the new ISINs into the sorted index rather than resorting
+            new = np.array(added, dtype=str)
+            new_rows = np.arange(len(old.isins), len(old.isins) + len(added))
+            by_isin = np.argsort(new, kind="stable")
+            new, new_rows = new[by_isin], new_rows[by_isin]
+            at = np.searchsorted(sorted_isins, new)
+            sorted_isins = np.insert(sorted_isins.astype(np.result_type(sorted_isins, new)), at, new)
+            order = np.insert(order, at, new_rows)
+
+        self._state = _State(index, np.concatenate([old.isins, np.array(added, dtype=object)]),
+                             columns, sorted_isins, order)
+        return len(rows)
+
+    def refresh(self):
+        """Pick up changes to the file; returns the number of instruments read."""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return 0
+            if stat.st_ino != self.inode or stat.st_size < self.offset:
+                self._rebuild()
+                return len(self)
+            if stat.st_size == self.offset:
+                return 0
+            return self._read_new()
+
+    def get(self, isin):
+        """Attributes of one instrument as a dict, or None if unknown."""
+        state = self._state
+        row = state.index.get(normalise_isin(isin))
+        if row is None:
+            return None
+        return {name: values[row].item() if name in blotter.NUMERIC_COLUMNS else values[row]
+                for name, values in state.columns.items()}
+
+    def _rows(self, state, isins):
+        isins = np.array([normalise_isin(i) for i in isins], dtype=str)
+        if not len(state.sorted):
+            return np.full(len(isins), -1, dtype=np.intp)
+        pos = np.minimum(np.searchsorted(state.sorted, isins), len(state.sorted) - 1)
+        return np.where(state.sorted[pos] == isins, state.order[pos], -1)
+
+    def rows(self, isins):
+        """Store row of each ISIN (vectorised), -1 where unknown."""
+        return self._rows(self._state, isins)
+
+    def fill(self, isins, columns):
+        """Fill empty attributes in columns (name -> list of values) from the store.
+
+        Values given with the trade are kept; numeric gaps are NaN and text
+        gaps None, as produced by the blotter parsers.
+        """
+        state = self._state
+        rows = self._rows(state, isins)
+        known = rows >= 0
+        if not known.any():
+            return columns
+        filled = dict(columns)
+        for name in ATTRIBUTES:
+            numeric = name in blotter.NUMERIC_COLUMNS
+            given = columns.get(name)
+            if given is None:
+                given = [math.nan if numeric else None] * len(rows)
+            values = np.array(given, dtype=float if numeric else object)
+            missing = known & (np.isnan(values) if numeric else np.equal(values, None))
+            if missing.any():
+                values[missing] = state.columns[name][rows[missing]]
+                filled[name] = values.tolist()
+        return filled
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def load(path=None):
+    """Shared store for path (default: $INSTRUMENTS_FILE), or None if unset.
+
+    The store is refreshed from the file on every call, which only costs a
+    stat() when nothing changed.
+    """
+    path = path or INSTRUMENTS_FILE
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = InstrumentStore(path)
+            return store
+    store.refresh()
+    return store
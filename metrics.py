@@ -0,0 +1,253 @@
+"""
+Opt-in Prometheus-style metrics for the deferral callbacks.
+
+Set METRICS_DIR to a directory shared by all gunicorn workers to enable it.
+Functions decorated with instrument() then record
+
+    deferral_function_duration_seconds   latency histogram, per function
+    deferral_function_calls_total        calls, per function
+    deferral_function_errors_total       exceptions (including PreventUpdate), per function and type
+    deferral_outcomes_total              outcomes, per function, regime and outcome key
+    deferral_fallbacks_total             "Unknown condition", "Enter all fields or contact ICMA"
+                                         and missing input answers, per function and message
+
+Each worker counts in memory and a background thread writes its totals to
+METRICS_DIR/metrics-<pid>.json every METRICS_FLUSH_INTERVAL seconds; render()
+sums the files of all workers, so the figures do not depend on which worker
+answers the scrape. Totals of workers that exited are kept, as Prometheus
+expects counters never to go down; empty the directory when deploying.
+
+With METRICS_DIR unset instrument() returns the function unchanged, so the
+callbacks pay nothing.
+"""
+
+import atexit
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+import deferral_rules
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1"))
+ENABLED = bool(METRICS_DIR)
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+FALLBACK_OUTCOMES = ("UNKNOWN", "INCOMPLETE")
+MISSING_INPUT = "Please fill all fields then click Calculate."
+
+HELP = {
+    "deferral_function_duration_seconds": ("histogram", "Time spent in the deferral function."),
+    "deferral_function_calls_total": ("counter", "Calls of the deferral function."),
+    "deferral_function_errors_total": ("counter", "Exceptions raised by the deferral function."),
+    "deferral_outcomes_total": ("counter", "Deferral outcomes returned, per regime."),
+    "deferral_fallbacks_total": ("counter", "Answers that are not a deferral period."),
+}
+
+# Outcome key of each (regime, message), to count what the callbacks return
+_OUTCOME_OF = {(regime, text): key for regime, messages in deferral_rules.MESSAGES.items()
+               for key, text in messages.items()}
+
+_lock = threading.Lock()
+_histograms = {}
+_errors = {}
+_answers = {}
+_flusher = None
+_dirty = False
+
+
+def _reset():
+    global _histograms, _errors, _answers, _flusher, _dirty, _lock
+    _lock = threading.Lock()
+    _histograms, _errors, _answers, _flusher, _dirty = {}, {}, {}, None, False
+
+
+if hasattr(os, "register_at_fork"):
+    # Each worker reports only what it counted itself
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _record(function, seconds, error, answers):
+    # The hot path only bumps raw counts; they are turned into labelled
+    # counters when the worker's totals are written out
+    global _dirty
+    with _lock:
+        h = _histograms.get(function)
+        if h is None:
+            h = _histograms[function] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        h[0][bisect_left(BUCKETS, seconds)] += 1
+        h[1] += seconds
+        h[2] += 1
+        if error is not None:
+            key = (function, error)
+            _errors[key] = _errors.get(key, 0) + 1
+        for key in answers:
+            _answers[key] = _answers.get(key, 0) + 1
+        _dirty = True
+    if _flusher is None:
+        _start_flusher()
+
+
+def instrument(function, regimes, text=str):
+    """Decorator recording latency, errors and outcomes of a deferral function.
+
+    regimes names the regime of each returned value (a single value is
+    treated as a 1-tuple); None skips a value. text(value) turns a returned
+    value back into the message shown to the user.
+    """
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+        positions = [(i, regime) for i, regime in enumerate(regimes) if regime is not None]
+        missing = ((function, regimes[0], MISSING_INPUT),)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as exc:
+                _record(function, time.perf_counter() - start, type(exc).__name__, ())
+                raise
+            elapsed = time.perf_counter() - start
+            values = result if type(result) is tuple else (result,)
+            if values[0] == MISSING_INPUT:
+                answers = missing
+            else:
+                answers = [(function, regime, text(values[i])) for i, regime in positions]
+            _record(function, elapsed, None, answers)
+            return result
+        return wrapper
+    return decorator
+
+
+def _counters():
+    counters = {}
+
+    def inc(name, labels, amount):
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    for function, h in _histograms.items():
+        inc("deferral_function_calls_total", (("function", function),), h[2])
+    for (function, error), n in _errors.items():
+        inc("deferral_function_errors_total", (("function", function), ("error", error)), n)
+    for (function, regime, text), n in _answers.items():
+        if text == MISSING_INPUT:
+            inc("deferral_fallbacks_total", (("function", function), ("reason", text)), n)
+            continue
+        key = _OUTCOME_OF.get((regime, text), "other")
+        inc("deferral_outcomes_total", (("function", function), ("regime", regime), ("outcome", key)), n)
+        if key in FALLBACK_OUTCOMES:
+            inc("deferral_fallbacks_total", (("function", function), ("reason", text)), n)
+    return counters
+
+
+def _path(pid=None):
+    return os.path.join(METRICS_DIR, f"metrics-{pid or os.getpid()}.json")
+
+
+def _snapshot():
+    with _lock:
+        return {
+            "counters": [[name, [list(label) for label in labels], value]
+                         for (name, labels), value in _counters().items()],
+            "histograms": {function: [list(h[0]), h[1], h[2]] for function, h in _histograms.items()},
+        }
+
+
+def flush():
+    """Write this worker's totals to METRICS_DIR."""
+    global _dirty
+    if not ENABLED or not _dirty:
+        return
+    import json
+
+    _dirty = False
+    path = _path()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _start_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is not None:
+            return
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _flusher = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+        _flusher.start()
+
+
+atexit.register(lambda: ENABLED and flush())
+
+
+def collect():
+    """Totals summed over every worker's file: (counters, histograms)."""
+    import glob
+    import json
+
+    flush()
+    counters, histograms = {}, {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data["counters"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for function, (buckets, total, count) in data["histograms"].items():
+            h = histograms.setdefault(function, [[0] * (len(BUCKETS) + 1), 0.0, 0])
+            h[0] = [a + b for a, b in zip(h[0], buckets)]
+            h[1] += total
+            h[2] += count
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    counters, histograms = collect()
+    lines = []
+    name = "deferral_function_duration_seconds"
+    lines += [f"# HELP {name} {HELP[name][1]}", f"# TYPE {name} histogram"]
+    for function, (buckets, total, count) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), buckets):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels((('function', function), ('le', le)))} {cumulative}")
+        lines.append(f"{name}_sum{_labels((('function', function),))} {total}")
+        lines.append(f"{name}_count{_labels((('function', function),))} {count}")
+
+    for name, (kind, text) in HELP.items():
+        if kind != "counter":
+            continue
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} counter"]
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
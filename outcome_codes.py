@@ -0,0 +1,204 @@
+"""
+Compact integer coding of deferral outcomes and a columnar result file.
+
+An outcome is split into four small codes: the price deferral and volume
+deferral periods (Deferral), the Regime (UK or EU) and the AssetClass. The
+five result columns of a blotter are fixed (regime, asset class) pairs, so a
+batch result is just two uint8 matrices, price[trade, column] and
+volume[trade, column]: two bytes per trade and regime instead of a sentence.
+
+ResultWriter spools those matrices to disk chunk by chunk and writes them as
+a compressed .npz file together with the column definitions, so memory use
+does not grow with the number of trades. The English
+messages shown by the Dash callbacks are only produced when asked for, with
+messages() or from the command line:
+
+    python outcome_codes.py results.npz > results.csv
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from enum import IntEnum
+
+import numpy as np
+
+import deferral_rules
+from deferral_rules import OUTCOMES, REGIMES
+
+
+class Deferral(IntEnum):
+    NONE = 0          # the rules give no outcome
+    REAL_TIME = 1
+    MINUTES_15 = 2
+    END_OF_DAY = 3
+    DAYS_1 = 4
+    WEEKS_1 = 5
+    WEEKS_2 = 6
+    WEEKS_4 = 7
+    MONTHS_3 = 8
+    UNKNOWN = 9       # "Unknown condition"
+    INCOMPLETE = 10   # "Enter all fields or contact ICMA"
+
+
+class Regime(IntEnum):
+    UK = 1
+    EU = 2
+
+
+class AssetClass(IntEnum):
+    SOVEREIGN = 1
+    CORPORATE = 2
+    COVERED = 3
+
+
+# (price, volume) deferral of each outcome key
+SPLIT = {
+    None: (Deferral.NONE, Deferral.NONE),
+    "RT": (Deferral.REAL_TIME, Deferral.REAL_TIME),
+    "15M": (Deferral.MINUTES_15, Deferral.MINUTES_15),
+    "EOD": (Deferral.END_OF_DAY, Deferral.END_OF_DAY),
+    "1D": (Deferral.DAYS_1, Deferral.DAYS_1),
+    "EOD_1W": (Deferral.END_OF_DAY, Deferral.WEEKS_1),
+    "EOD_2W": (Deferral.END_OF_DAY, Deferral.WEEKS_2),
+    "2W": (Deferral.WEEKS_2, Deferral.WEEKS_2),
+    "4W": (Deferral.WEEKS_4, Deferral.WEEKS_4),
+    "3M": (Deferral.MONTHS_3, Deferral.MONTHS_3),
+    "UNKNOWN": (Deferral.UNKNOWN, Deferral.UNKNOWN),
+    "INCOMPLETE": (Deferral.INCOMPLETE, Deferral.INCOMPLETE),
+}
+
+# Result columns, in deferral_rules.REGIMES order
+COLUMNS = {
+    "uk_sovereign": (Regime.UK, AssetClass.SOVEREIGN),
+    "uk_corporate": (Regime.UK, AssetClass.CORPORATE),
+    "eu_sovereign": (Regime.EU, AssetClass.SOVEREIGN),
+    "eu_corporate": (Regime.EU, AssetClass.CORPORATE),
+    "eu_covered": (Regime.EU, AssetClass.COVERED),
+}
+
+# Engine outcome code -> price / volume code
+PRICE = np.array([SPLIT[key][0] for key in OUTCOMES], dtype=np.uint8)
+VOLUME = np.array([SPLIT[key][1] for key in OUTCOMES], dtype=np.uint8)
+
+# (price, volume) -> engine outcome code, as a dense matrix
+_OUTCOME_OF = np.zeros((len(Deferral), len(Deferral)), dtype=np.int8)
+for _code, _key in enumerate(OUTCOMES):
+    _OUTCOME_OF[SPLIT[_key]] = _code
+
+
+def encode(codes):
+    """(price, volume) uint8 matrices, one column per regime, from the
+    {regime: outcome code array} returned by deferral_engine.classify()."""
+    outcome = np.stack([np.asarray(codes[regime]) for regime in REGIMES], axis=1)
+    return PRICE[outcome], VOLUME[outcome]
+
+
+def outcomes(price, volume):
+    """Engine outcome codes back from price / volume codes."""
+    return _OUTCOME_OF[price, volume]
+
+
+def messages(price, volume, regime):
+    """Callback message of each trade for one regime, decoded on demand."""
+    column = REGIMES.index(regime)
+    return _message_table(regime)[outcomes(price[:, column], volume[:, column])]
+
+
+_MESSAGES = {}
+
+
+def _message_table(regime):
+    table = _MESSAGES.get(regime)
+    if table is None:
+        table = _MESSAGES[regime] = np.array(
+            [deferral_rules.message(regime, key) or "" for key in OUTCOMES], dtype=object)
+    return table
+
+
+class ResultWriter:
+    """Writes coded results chunk by chunk to an .npz file.
+
+    Chunks are appended to temporary files next to the output, so only one
+    chunk is in memory at a time. close() streams them into the archive
+    behind .npy headers, once the number of rows is known; the file reads
+    like one from np.savez_compressed().
+    """
+
+    MATRICES = ("price", "volume")
+
+    def __init__(self, path):
+        path = os.fspath(path)
+        self.path = path if path.endswith(".npz") else path + ".npz"
+        directory = os.path.dirname(os.path.abspath(self.path))
+        self._spool = {name: tempfile.TemporaryFile(dir=directory) for name in self.MATRICES}
+        self.rows = 0
+
+    def append(self, codes):
+        price, volume = encode(codes)
+        self._spool["price"].write(price.tobytes())
+        self._spool["volume"].write(volume.tobytes())
+        self.rows += len(price)
+
+    def close(self):
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.uint8)), "fortran_order": False,
+                  "shape": (self.rows, len(REGIMES))}
+        try:
+            with zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+                for name, spool in self._spool.items():
+                    spool.seek(0)
+                    with zf.open(name + ".npy", "w", force_zip64=True) as out:
+                        np.lib.format.write_array_header_1_0(out, header)
+                        shutil.copyfileobj(spool, out)
+                for name, values in (
+                        ("columns", np.array(REGIMES)),
+                        ("regime", np.array([COLUMNS[r][0] for r in REGIMES], dtype=np.uint8)),
+                        ("asset_class", np.array([COLUMNS[r][1] for r in REGIMES], dtype=np.uint8))):
+                    with zf.open(name + ".npy", "w") as out:
+                        np.lib.format.write_array(out, values)
+        finally:
+            self.discard()
+
+    def discard(self):
+        for spool in self._spool.values():
+            spool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def load(path):
+    """(price, volume) matrices of a file written by ResultWriter."""
+    with np.load(path) as data:
+        if tuple(data["columns"]) != REGIMES:
+            raise ValueError(f"{path} has columns {list(data['columns'])}, expected {list(REGIMES)}")
+        return data["price"], data["volume"]
+
+
+def main(argv=None):
+    import blotter
+
+    parser = argparse.ArgumentParser(description="Decode a coded result file to CSV messages on stdout.")
+    parser.add_argument("path", help=".npz file written by classify_trades.py --npz")
+    args = parser.parse_args(argv)
+
+    price, volume = load(args.path)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(blotter.RESULT_COLUMNS.values())
+    decoded = [messages(price, volume, regime) for regime in blotter.RESULT_COLUMNS]
+    writer.writerows(zip(*decoded))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Multi-core classification of large batches.
+
+classify() has the same inputs and outputs as deferral_engine.classify(), but
+splits the trades into contiguous shards and classifies them on a pool of
+worker processes. The parent hashes each text column once into int32 codes
+(deferral_engine.encode) and looks up what each distinct value decides -
+segment, liquidity, default fx rates - once (deferral_engine.lookups). Sizes,
+any given rates and the codes are copied into a single
+multiprocessing.shared_memory block; the small lookup arrays go with each
+shard. Workers attach to the block, gather their slice of rows by code,
+compare sizes (deferral_engine.classify_codes) and write the
+outcome codes into a shared output block at the same offsets, so the result
+is in the original order without any reassembly and no trade is pickled.
+
+The pool is started once per process (forkserver, so it is safe to use from
+the blotter's background threads) and reused. Batches smaller than
+MIN_ROWS are classified in-process, where starting shards costs more than it
+saves.
+
+WORKERS ($DEFERRAL_WORKERS, default 1) is the default for the batch entry
+points served by the web app; the command line takes --workers.
+"""
+
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import deferral_engine
+import deferral_rules
+from deferral_rules import REGIMES
+
+WORKERS = int(os.environ.get("DEFERRAL_WORKERS", "1"))
+MIN_ROWS = 20000
+SHARDS_PER_WORKER = 2
+
+LABEL_COLUMNS = deferral_engine.LABEL_COLUMNS
+
+_pools = {}
+
+
+def pool(workers):
+    executor = _pools.get(workers)
+    if executor is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        executor = _pools[workers] = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context(method))
+    return executor
+
+
+def _layout(n, floats):
+    # Offsets of each column in the shared input block
+    layout, offset = {}, 0
+    for name in floats:
+        layout[name] = (offset, np.float64)
+        offset += n * 8
+    for name in LABEL_COLUMNS:
+        layout[name] = (offset, np.int32)
+        offset += n * 4
+    return layout, offset
+
+
+def _views(buf, layout, n):
+    return {name: np.ndarray((n,), dtype=dtype, buffer=buf, offset=offset)
+            for name, (offset, dtype) in layout.items()}
+
+
+def _classify_shard(inputs, outputs, n, floats, lookups, rules, start, stop):
+    layout, _ = _layout(n, floats)
+    shm_in = shared_memory.SharedMemory(name=inputs)
+    shm_out = shared_memory.SharedMemory(name=outputs)
+    try:
+        columns = _views(shm_in.buf, layout, n)
+        out = np.ndarray((len(REGIMES), n), dtype=np.int8, buffer=shm_out.buf)
+        codes = deferral_engine.classify_codes(
+            deferral_engine.tables(rules),
+            {name: columns[name][start:stop] for name in LABEL_COLUMNS}, lookups,
+            **{name: columns[name][start:stop] for name in floats})
+        for i, regime in enumerate(REGIMES):
+            out[i, start:stop] = codes[regime]
+        del columns, out
+    finally:
+        shm_in.close()
+        shm_out.close()
+    return stop - start
+
+
+def classify(issue_currency, issue_size, trade_size, maturity=None, issuer_country=None,
+             strip_inflation=None, rating=None, eur_rate=None, gbp_rate=None, rules=None,
+             workers=None, trade_date=None):
+    """deferral_engine.classify() spread over `workers` processes."""
+    workers = WORKERS if workers is None else workers
+    if rules is None and trade_date is not None:
+        # One sharded pass per rules version, each with fixed tables
+        return deferral_engine.by_rule_version(
+            functools.partial(classify, workers=workers), trade_date,
+            issue_currency=issue_currency, issue_size=issue_size, trade_size=trade_size, maturity=maturity,
+            issuer_country=issuer_country, strip_inflation=strip_inflation, rating=rating,
+            eur_rate=eur_rate, gbp_rate=gbp_rate)
+    trade_size = np.asarray(trade_size, dtype=float)
+    n = len(trade_size) if trade_size.ndim == 1 else 0
+    if workers <= 1 or n < MIN_ROWS:
+        return deferral_engine.classify(issue_currency, issue_size, trade_size, maturity,
+                                        issuer_country, strip_inflation, rating,
+                                        eur_rate=eur_rate, gbp_rate=gbp_rate, rules=rules)
+
+    # The only per-row work before sharding: one hashing pass per text
+    # column. Everything a text value decides (segment, liquidity, default
+    # rates) is looked up once per distinct value, so the workers only gather
+    # by code and compare sizes.
+    rules = rules or deferral_rules.current()
+    labels = {"issue_currency": issue_currency, "maturity": maturity, "issuer_country": issuer_country,
+              "strip_inflation": strip_inflation, "rating": rating}
+    encoded = {name: deferral_engine.encode(values) for name, values in labels.items()}
+    lookups = deferral_engine.lookups(deferral_engine.tables(rules),
+                                      {name: distinct for name, (_, distinct) in encoded.items()})
+    floats = {"issue_size": issue_size, "trade_size": trade_size, "eur_rate": eur_rate, "gbp_rate": gbp_rate}
+    floats = {name: values for name, values in floats.items() if values is not None}
+
+    layout, size = _layout(n, floats)
+    shm_in = shared_memory.SharedMemory(create=True, size=size)
+    shm_out = shared_memory.SharedMemory(create=True, size=len(REGIMES) * n)
+    try:
+        columns = _views(shm_in.buf, layout, n)
+        for name, values in floats.items():
+            columns[name][:] = values
+        for name, (codes, _) in encoded.items():
+            columns[name][:] = codes
+        del columns
+
+        bounds = np.linspace(0, n, workers * SHARDS_PER_WORKER + 1).astype(int)
+        futures = [pool(workers).submit(_classify_shard, shm_in.name, shm_out.name, n, tuple(floats),
+                                        lookups, rules, int(start), int(stop))
+                   for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        for future in futures:
+            future.result()
+
+        out = np.ndarray((len(REGIMES), n), dtype=np.int8, buffer=shm_out.buf)
+        result = {regime: out[i].copy() for i, regime in enumerate(REGIMES)}
+        del out
+        return result
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
@@ -0,0 +1,219 @@
+"""
+Streaming deferral service for real-time trade feeds.
+
+    python stream_service.py --port 8765            # TCP on localhost
+    python stream_service.py --unix /tmp/deferrals.sock
+
+Clients send one JSON trade per line, with the fields of the blotter
+(issue_currency, issue_size, trade_size, maturity, issuer_country,
+strip_inflation, rating, and optionally trade_date or isin) plus an optional
+"id", and get one line back per trade, in the order sent:
+
+    {"id": 42, "outcomes": {"uk_sovereign": "1D", "eu_sovereign": "RT", ...}}
+
+Outcomes are the keys of deferral_rules.OUTCOMES, as in the JSON API, from
+the same engine as the blotter. A line that is not a JSON object gets
+{"id": null, "error": ...}.
+
+Trades from all connections go through one bounded queue. A single batcher
+task takes whatever is waiting (up to --max-batch trades) and classifies it in
+one vectorised pass, so batches grow with load while a lone trade is
+answered immediately. When the queue is full, connections stop being read,
+which pushes back on the senders through TCP flow control instead of
+buffering without limit. Latency from receiving a line to writing its answer
+is reported as p50/p99 on stderr every --report-every seconds.
+
+benchmarks/feed_simulator.py drives the service end to end.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import sys
+import time
+
+import numpy as np
+
+import blotter
+import deferral_rules
+import fx_history
+import instruments
+
+logger = logging.getLogger("stream_service")
+
+FIELDS = blotter.COLUMNS + (blotter.TRADE_DATE, blotter.ISIN)
+MAX_BATCH = 1024
+QUEUE_SIZE = 10000
+LATENCY_WINDOW = 100000
+
+_KEYS = np.array(deferral_rules.OUTCOMES, dtype=object)
+
+
+class StreamService:
+
+    def __init__(self, max_batch=MAX_BATCH, queue_size=QUEUE_SIZE, fx=None, store=None):
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(queue_size)
+        self.fx = fx
+        self.store = store
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.trades = self.batches = 0
+        self.connections = set()
+
+    def classify(self, trades):
+        """Outcome keys for a list of trade dicts, one dict per trade."""
+        rows = [[trade.get(name) for name in FIELDS] for trade in trades]
+        codes = blotter.classify_codes(FIELDS, rows, self.fx, workers=1, instruments=self.store)
+        keys = {regime: _KEYS[c].tolist() for regime, c in codes.items()}
+        return [{regime: keys[regime][i] for regime in keys} for i in range(len(trades))]
+
+    async def batcher(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                results = self.classify([trade for trade, _ in batch])
+            except Exception as exc:
+                logger.exception("Could not classify a batch of %d trades", len(batch))
+                for _, future in batch:
+                    future.set_exception(exc)
+            else:
+                for (_, future), outcomes in zip(batch, results):
+                    future.set_result(outcomes)
+            self.trades += len(batch)
+            self.batches += 1
+            # Let the connection writers and readers run between batches
+            await asyncio.sleep(0)
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        task.add_done_callback(self.connections.discard)
+        pending = asyncio.Queue(self.queue.maxsize)
+        respond = asyncio.ensure_future(self._respond(pending, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received = time.perf_counter()
+                try:
+                    trade = json.loads(line)
+                    if not isinstance(trade, dict):
+                        raise ValueError("Expected a JSON object")
+                except ValueError as exc:
+                    await pending.put((None, None, received, str(exc)))
+                    continue
+                # Checked here rather than in the batch, which one bad date would fail
+                try:
+                    blotter.parse_date(trade.get(blotter.TRADE_DATE))
+                except ValueError as exc:
+                    await pending.put((trade.get("id"), None, received, f"{blotter.TRADE_DATE}: {exc}"))
+                    continue
+                future = asyncio.get_running_loop().create_future()
+                await self.queue.put((trade, future))
+                await pending.put((trade.get("id"), future, received, None))
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await respond
+
+    async def _respond(self, pending, writer):
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+                trade_id, future, received, error = item
+                if error is None:
+                    try:
+                        response = {"id": trade_id, "outcomes": await future}
+                    except Exception as exc:
+                        response = {"id": trade_id, "error": str(exc)}
+                else:
+                    response = {"id": trade_id, "error": error}
+                writer.write(json.dumps(response).encode() + b"\n")
+                if pending.empty():
+                    await writer.drain()
+                self.latencies.append(time.perf_counter() - received)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def wait_closed(self):
+        """Wait until every client connection has been answered and closed."""
+        await asyncio.gather(*self.connections, return_exceptions=True)
+
+    def latency(self):
+        """p50/p99 latency in microseconds over the recent window."""
+        if not self.latencies:
+            return None
+        p50, p99 = np.percentile(np.fromiter(self.latencies, dtype=float), [50, 99]) * 1e6
+        return {"p50_us": p50, "p99_us": p99, "trades": self.trades,
+                "mean_batch": self.trades / self.batches if self.batches else 0.0}
+
+    async def report(self, every):
+        while True:
+            await asyncio.sleep(every)
+            stats = self.latency()
+            if stats:
+                logger.info("%(trades)d trades, mean batch %(mean_batch).1f, "
+                            "latency p50 %(p50_us).0fus p99 %(p99_us).0fus", stats)
+
+
+async def serve(args):
+    service = StreamService(args.max_batch, args.queue_size,
+                            fx_history.load(args.fx_history) if args.fx_history else None,
+                            instruments.load(args.instruments) if args.instruments else None)
+    if args.unix:
+        server = await asyncio.start_unix_server(service.handle, path=args.unix)
+    else:
+        server = await asyncio.start_server(service.handle, args.host, args.port)
+    tasks = [asyncio.ensure_future(service.batcher())]
+    if args.report_every:
+        tasks.append(asyncio.ensure_future(service.report(args.report_every)))
+    logger.info("Listening on %s", args.unix or f"{args.host}:{args.port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        stats = service.latency()
+        if stats:
+            logger.info("%(trades)d trades, latency p50 %(p50_us).0fus p99 %(p99_us).0fus", stats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify a live trade feed over a socket (JSON lines).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH,
+                        help="most trades classified in one pass (default: %(default)s)")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="trades waiting to be classified before senders are held back "
+                             "(default: %(default)s)")
+    parser.add_argument("--fx-history", default=fx_history.FX_HISTORY_FILE,
+                        help="CSV of dated EUR rates for trades with a trade_date (default: $FX_HISTORY_FILE)")
+    parser.add_argument("--instruments", default=instruments.INSTRUMENTS_FILE,
+                        help="CSV of instrument reference data by ISIN (default: $INSTRUMENTS_FILE)")
+    parser.add_argument("--report-every", type=float, default=10.0,
+                        help="seconds between latency reports on stderr, 0 to only report on exit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(message)s")
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
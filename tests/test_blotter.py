@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+import blotter  # noqa: E402
+import fx_history  # noqa: E402
+from fx_rates import eur_xe, gbp_xe  # noqa: E402
+
+TRADE = ["USD", "600000000", "2000000", "5-10", "United States", "", "Investment Grade"]
+
+
+def _history(tmp_path):
+    path = tmp_path / "fx.csv"
+    path.write_text("date,currency,eur\n2024-01-02,USD,0.5\n2024-01-02,GBP,1.25\n")
+    return fx_history.load(str(path))
+
+
+def test_undated_rows_use_snapshot_rates_with_fx_history(tmp_path):
+    fx = _history(tmp_path)
+    header = list(blotter.COLUMNS) + [blotter.TRADE_DATE]
+    rows = [TRADE + ["2024-03-01"], TRADE + [""], TRADE + [None]]
+
+    columns = blotter.parse_chunk(header, rows, fx)
+    np.testing.assert_allclose(columns["eur_rate"], [0.5, eur_xe["USD"], eur_xe["USD"]])
+    np.testing.assert_allclose(columns["gbp_rate"], [0.4, gbp_xe["USD"], gbp_xe["USD"]])
+
+    # The same trade in a file without the column
+    codes = blotter.classify_codes(header, rows, fx)
+    undated = blotter.classify_codes(list(blotter.COLUMNS), [TRADE], fx)
+    for regime, expected in undated.items():
+        assert codes[regime][1] == codes[regime][2] == expected[0]
+
+
+def test_history_rates_without_undated_rows(tmp_path):
+    fx = _history(tmp_path)
+    header = list(blotter.COLUMNS) + [blotter.TRADE_DATE]
+    columns = blotter.parse_chunk(header, [TRADE + ["2024-03-01"]], fx)
+    np.testing.assert_allclose(columns["eur_rate"], [0.5])
+
+
+def test_malformed_trade_date_names_the_row():
+    header = list(blotter.COLUMNS) + [blotter.TRADE_DATE]
+    rows = [TRADE + ["2025-05-31"], TRADE + [""], TRADE + ["31/05/2025"]]
+    with pytest.raises(blotter.RowError, match="row 12: trade_date: Invalid date '31/05/2025'") as exc:
+        blotter.parse_chunk(header, rows, first_row=10)
+    assert exc.value.row == 12
+    for value in ("2025-5-31", "2025-02-30", "20250531"):
+        with pytest.raises(ValueError):
+            blotter.parse_date(value)
@@ -0,0 +1,24 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deferral_rules  # noqa: E402
+
+SHIPPED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "deferral_rules.json")
+
+
+def test_reload_with_a_misspelt_parameter_keeps_the_old_rules(tmp_path, monkeypatch):
+    with open(SHIPPED) as f:
+        spec = json.load(f)
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(spec))
+    monkeypatch.setattr(deferral_rules, "RULES_FILE", str(path))
+    monkeypatch.setattr(deferral_rules, "_history", None)
+    good = deferral_rules.reload()
+
+    spec["uk_sovereign"]["liquid_countrys"] = spec["uk_sovereign"].pop("liquid_countries")
+    path.write_text(json.dumps(spec))
+    assert deferral_rules.reload() is good
+    assert deferral_rules.uk_sovereign(3e9, 1e6, "<5", "UK", "No") is not None
@@ -0,0 +1,193 @@
+"""
+Volume distributions of deferral outcomes, built in one pass.
+
+    python volume_summary.py blotter.csv --name "Q3 2024"
+
+VolumeSummary counts, for each result column (regime and asset class) and
+outcome, the trades and their notional in EUR. Each chunk of the blotter adds
+one np.bincount per column, so a file of any size is summarised in a single
+streaming pass with constant memory; the raw trades are never kept.
+
+Summaries are saved as small JSON files in SUMMARIES_DIR ($SUMMARIES_DIR,
+default: a folder in the system temp dir), which the /analytics page of the
+Dash app lists and charts. Chart interactions only regroup the saved
+matrices (e.g. by price or by volume deferral with outcome_codes), they never
+read the trades again.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+import tempfile
+
+import numpy as np
+
+import blotter
+import deferral_engine
+import deferral_rules
+import fx_history
+import instruments
+import outcome_codes
+import parallel
+from deferral_rules import OUTCOMES, REGIMES
+from fx_rates import eur_xe
+from outcome_codes import Deferral
+
+SUMMARIES_DIR = os.environ.get(
+    "SUMMARIES_DIR", os.path.join(tempfile.gettempdir(), "trade-deferral-checker-summaries"))
+
+MEASURES = {"volume": "Share of EUR notional", "trades": "Share of trades"}
+
+PERIODS = {
+    Deferral.REAL_TIME: "Real time",
+    Deferral.MINUTES_15: "15 minutes",
+    Deferral.END_OF_DAY: "End of day",
+    Deferral.DAYS_1: "1 day",
+    Deferral.WEEKS_1: "1 week",
+    Deferral.WEEKS_2: "2 weeks",
+    Deferral.WEEKS_4: "4 weeks",
+    Deferral.MONTHS_3: "3 months",
+    Deferral.UNKNOWN: "Unknown condition",
+    Deferral.INCOMPLETE: "Incomplete",
+    Deferral.NONE: "Not defined",
+}
+
+
+class VolumeSummary:
+    """Trades and EUR notional per (result column, outcome code)."""
+
+    def __init__(self, name=None, source=None):
+        self.name = name
+        self.source = source
+        self.rows = 0
+        self.trades = np.zeros((len(REGIMES), len(OUTCOMES)), dtype=np.int64)
+        self.volume = np.zeros((len(REGIMES), len(OUTCOMES)))
+        self.created = None
+        self.rules_version = None
+
+    def add(self, codes, notional_eur):
+        """Add a classified chunk: {regime: code array} and the EUR notional of each trade."""
+        weights = np.nan_to_num(np.asarray(notional_eur, dtype=float), nan=0.0)
+        for i, regime in enumerate(REGIMES):
+            self.trades[i] += np.bincount(codes[regime], minlength=len(OUTCOMES))
+            self.volume[i] += np.bincount(codes[regime], weights=weights, minlength=len(OUTCOMES))
+        self.rows += len(weights)
+
+    def distribution(self, measure="volume", by="price"):
+        """{regime: {Deferral: share}} of trades or notional, by price or volume deferral."""
+        matrix = self.volume if measure == "volume" else self.trades
+        periods = outcome_codes.PRICE if by == "price" else outcome_codes.VOLUME
+        result = {}
+        for i, regime in enumerate(REGIMES):
+            totals = np.bincount(periods, weights=matrix[i], minlength=len(Deferral))
+            total = totals.sum()
+            result[regime] = {Deferral(d): float(totals[d] / total) if total else 0.0 for d in range(len(Deferral))}
+        return result
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "source": self.source,
+            "created": self.created,
+            "rules_version": self.rules_version,
+            "rows": self.rows,
+            "columns": list(REGIMES),
+            "outcomes": list(OUTCOMES),
+            "trades": self.trades.tolist(),
+            "volume_eur": self.volume.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if tuple(data["columns"]) != REGIMES or tuple(data["outcomes"]) != OUTCOMES:
+            raise ValueError("Summary was saved with different regimes or outcome codes")
+        summary = cls(data.get("name"), data.get("source"))
+        summary.created = data.get("created")
+        summary.rules_version = data.get("rules_version")
+        summary.rows = data["rows"]
+        summary.trades[:] = data["trades"]
+        summary.volume[:] = data["volume_eur"]
+        return summary
+
+    def save(self, path=None):
+        """Write the summary as JSON (default: SUMMARIES_DIR/<name>.json), returning the path."""
+        self.created = self.created or datetime.datetime.now().isoformat(timespec="seconds")
+        self.rules_version = self.rules_version or deferral_rules.history().version
+        if path is None:
+            os.makedirs(SUMMARIES_DIR, exist_ok=True)
+            path = os.path.join(SUMMARIES_DIR, f"{slug(self.name or self.source or 'summary')}.json")
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+        return path
+
+
+def slug(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", str(name)).strip("-.") or "summary"
+
+
+def load(path):
+    with open(path) as f:
+        return VolumeSummary.from_dict(json.load(f))
+
+
+def saved(directory=None):
+    """(name, path) of the saved summaries, most recent first."""
+    directory = directory or SUMMARIES_DIR
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(".json")]
+    except OSError:
+        return []
+    paths = sorted((os.path.join(directory, n) for n in names), key=os.path.getmtime, reverse=True)
+    return [(os.path.splitext(os.path.basename(p))[0], p) for p in paths]
+
+
+def notional_eur(columns):
+    """EUR notional of each trade in parsed columns (see blotter.parse_chunk)."""
+    rate = columns.get("eur_rate")
+    if rate is None:
+        rate, = deferral_engine.default_rates(deferral_engine.labels(columns["issue_currency"]), eur_xe)
+    return columns["trade_size"] * rate
+
+
+def summarise(path, fmt=None, name=None, chunk_size=blotter.CHUNK_SIZE, fx=None, workers=1, store=None):
+    """Stream a CSV or Excel blotter into a VolumeSummary."""
+    fmt = fmt or blotter.file_format(path)
+    summary = VolumeSummary(name, os.path.basename(path))
+    header, rows, _ = blotter.read_rows(path, fmt)
+    for chunk in blotter.chunks(rows, chunk_size * workers):
+        columns = blotter.parse_chunk(header, chunk, fx, store)
+        summary.add(parallel.classify(**columns, workers=workers), notional_eur(columns))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise the deferral outcomes of a blotter for /analytics.")
+    parser.add_argument("input", help="CSV or Excel blotter")
+    parser.add_argument("--name", help="summary name shown on the page (default: the file name)")
+    parser.add_argument("-o", "--output", help="JSON file to write (default: $SUMMARIES_DIR/<name>.json)")
+    parser.add_argument("--chunk-size", type=int, default=blotter.CHUNK_SIZE,
+                        help="trades classified per batch (default: %(default)s)")
+    parser.add_argument("--fx-history", default=fx_history.FX_HISTORY_FILE,
+                        help="CSV of dated EUR rates for trades with a trade_date (default: $FX_HISTORY_FILE)")
+    parser.add_argument("--instruments", default=instruments.INSTRUMENTS_FILE,
+                        help="CSV of instrument reference data by ISIN (default: $INSTRUMENTS_FILE)")
+    parser.add_argument("--workers", type=int, default=parallel.WORKERS,
+                        help="processes classifying in parallel (default: $DEFERRAL_WORKERS or 1)")
+    args = parser.parse_args(argv)
+
+    summary = summarise(args.input, name=args.name or os.path.basename(args.input),
+                        chunk_size=args.chunk_size, workers=max(args.workers, 1),
+                        fx=fx_history.load(args.fx_history) if args.fx_history else None,
+                        store=instruments.load(args.instruments) if args.instruments else None)
+    path = summary.save(args.output)
+    print(f"{summary.rows:,} trades summarised to {path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())